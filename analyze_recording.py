@@ -0,0 +1,42 @@
+import argparse
+
+from simulator.recorder import Recording
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a recording written by sim.py --record.')
+    parser.add_argument('recording', help='recording file')
+    parser.add_argument('--top', type=int, default=10, help='number of nodes and links to list')
+    parser.add_argument('--bucket', type=int, default=0,
+                        help='also print the routing messages delivered per this many time units')
+    args = parser.parse_args()
+
+    r = Recording(args.recording)
+    print("Scenario: %s, algorithm: %s, %d events" % (r.header["scenario"], r.header["algorithm"], len(r.records)))
+
+    traffic = r.node_traffic()
+    print("\n==== Node traffic (sent, sent chars, received, received chars) ====")
+    for node, counts in sorted(traffic.items(), key=lambda item: -item[1][0])[:args.top]:
+        print("%s: %d, %d, %d, %d" % ((node,) + counts))
+
+    load = r.link_load()
+    print("\n==== Link load (messages, chars) ====")
+    for link, counts in sorted(load.items(), key=lambda item: -item[1][0])[:args.top]:
+        print("%s-%s: %d, %d" % (link + counts))
+
+    print("\n==== Convergence (change time, changes, messages, last message, convergence time) ====")
+    for time_stamp, changes, messages, last in r.convergence():
+        if last is None:
+            print("%d: %d, 0, -, -" % (time_stamp, changes))
+        else:
+            print("%d: %d, %d, %d, %d" % (time_stamp, changes, messages, last, last - time_stamp))
+
+    if args.bucket > 0:
+        print("\n==== Messages per %d time units ====" % args.bucket)
+        for i, count in enumerate(r.message_histogram(args.bucket)):
+            print("%d: %d" % (i * args.bucket, count))
+
+
+if __name__ == '__main__':
+    # Try: python sim.py LINK_STATE demo.event --record demo.rec && python analyze_recording.py demo.rec
+    main()
@@ -0,0 +1,125 @@
+import numpy as np
+
+from distance_vector_node import Distance_Vector_Node
+
+
+class Dense_Distance_Vector_Node(Distance_Vector_Node):
+    """
+    Distance vector routing with the neighbors' vectors kept as rows of a NumPy
+    cost matrix (one column per destination), so recalculating the DV is one
+    vectorized min over the neighbors instead of a Python loop per destination.
+    Messages, ties and results are the same as Distance_Vector_Node's
+    """
+
+    def __init__(self, id):
+        super().__init__(id)
+
+        # Destination -> column (its node index, see Node.index_of), in the order destinations were added to self.dv
+        self.columns = {}
+        self.dest_columns = np.zeros(0, dtype=int)
+
+        # Neighbor -> row, and the neighbors_dv entry each row was built from
+        self.rows = {}
+        self.row_source = {}
+
+        # Neighbor's cost to each destination (inf if unknown), and whether we are on that path
+        self.cost = np.full((1, 1), float('inf'))
+        self.through_us = np.zeros((1, 1), dtype=bool)
+
+        # Result of the last recalculation per destination: cost, and row of the neighbor used (-1 for none)
+        self.best = np.zeros(0)
+        self.via = np.zeros(0, dtype=int)
+
+    def _grow(self, rows, columns):
+        # Make room for more neighbors / destinations (doubling, new cells unknown)
+        old_rows, old_columns = self.cost.shape
+        if rows <= old_rows and columns <= old_columns:
+            return
+        shape = (max(rows, 2 * old_rows if rows > old_rows else old_rows),
+                 max(columns, 2 * old_columns if columns > old_columns else old_columns))
+        cost = np.full(shape, float('inf'))
+        cost[:old_rows, :old_columns] = self.cost
+        through_us = np.zeros(shape, dtype=bool)
+        through_us[:old_rows, :old_columns] = self.through_us
+        self.cost, self.through_us = cost, through_us
+
+    def _load_row(self, neighbor):
+        # Copy a neighbor's DV into its row
+        if neighbor not in self.rows:
+            self.rows[neighbor] = len(self.rows)
+            self._grow(len(self.rows), self.cost.shape[1])
+        row = self.rows[neighbor]
+        self.cost[row] = float('inf')
+        self.through_us[row] = False
+        for dest, (cost, path) in self.neighbors_dv[neighbor]["dv"].items():
+            column = self.index_of(dest)
+            self.cost[row, column] = cost
+            self.through_us[row, column] = self.id in path
+        self.row_source[neighbor] = self.neighbors_dv[neighbor]
+
+    def _recalculate_dv(self, nodes_to_check):
+
+        # Pick up new destinations
+        dv = self.dv["dv"]
+        if len(self.columns) < len(dv):
+            for dest in dv:
+                if dest not in self.columns:
+                    self.columns[dest] = self.index_of(dest)
+            self.dest_columns = np.fromiter(self.columns.values(), dtype=int, count=len(self.columns))
+            self._grow(self.cost.shape[0], self.node_count())
+
+        # Neighbors we have a DV from, reloading rows whose DV was replaced
+        neighbors = [neighbor for neighbor in nodes_to_check if neighbor in self.neighbors_dv]
+        reloaded = []
+        for neighbor in neighbors:
+            if self.row_source.get(neighbor) is not self.neighbors_dv[neighbor]:
+                self._load_row(neighbor)
+                reloaded.append(self.rows[neighbor])
+
+        # Cost through each neighbor to each destination, leaving out paths that go through us
+        dests = list(self.columns)
+        rows = np.array([self.rows[neighbor] for neighbor in neighbors], dtype=int)
+        if neighbors:
+            links = np.array([self.outbound_links[neighbor] for neighbor in neighbors], dtype=float)
+            cells = np.ix_(rows, self.dest_columns)
+            total = links[:, None] + self.cost[cells]
+            total[self.through_us[cells]] = float('inf')
+
+            # Cheapest cost, and like the loop version the last neighbor among equally cheap ones
+            best = total.min(axis=0)
+            via = rows[len(neighbors) - 1 - np.argmax(total[::-1] == best, axis=0)]
+            via[best == float('inf')] = -1
+        else:
+            best = np.full(len(dests), float('inf'))
+            via = np.full(len(dests), -1)
+
+        # Only destinations (by position in dests) whose cost or next hop moved, or whose next hop sent a new DV, can change
+        if len(self.best) < len(dests):
+            self.best = np.concatenate([self.best, np.full(len(dests) - len(self.best), np.nan)])
+            self.via = np.concatenate([self.via, np.full(len(dests) - len(self.via), -1)])
+
+        # One spare slot at the end, so that via -1 reads False
+        was_reloaded = np.zeros(len(self.rows) + 1, dtype=bool)
+        was_reloaded[reloaded] = True
+        check = (best != self.best[:len(dests)]) | (via != self.via[:len(dests)]) | was_reloaded[via]
+        self.best[:len(dests)] = best
+        self.via[:len(dests)] = via
+        neighbor_of_row = {self.rows[neighbor]: neighbor for neighbor in neighbors}
+
+        # Write the new DV (costs recomputed in Python, so they keep their original type)
+        changed = False
+        for i in np.flatnonzero(check):
+            dest_node = dests[i]
+            if dest_node == self.id:
+                continue
+            if via[i] == -1:
+                entry = [float('inf'), []]
+            else:
+                neighbor = neighbor_of_row[via[i]]
+                cost, path = self.neighbors_dv[neighbor]["dv"][dest_node]
+                entry = [self.outbound_links[neighbor] + cost, [neighbor] + path]
+            if entry != dv[dest_node]:
+                dv[dest_node] = entry
+                changed = True
+
+        return changed
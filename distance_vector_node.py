@@ -157,6 +157,14 @@ class Distance_Vector_Node(Node):
         dest_path = self.dv["dv"][destination][1]
 
         return dest_path[0]
+
+    def get_routing_table(self):
+        """
+        Next hop and cost to every destination we can currently reach,
+        straight from our own DV
+        """
+        return {dest: (path[0], cost) for dest, (cost, path) in self.dv["dv"].items()
+                if dest != self.id and cost != float('inf')}
     
     def _recalculate_dv(self, nodes_to_check):
 
@@ -0,0 +1,153 @@
+import argparse
+import random
+
+from generate_simulation import MAX_LATENCY, random_weight, tee_events
+
+
+# Stress workloads for convergence measurements.
+#
+# A connected base topology (a ring for connectivity plus random chords, half of them to nearby
+# nodes) is built at time 0 and 1, then left to settle until `start`. From there one stress
+# pattern runs `intensity` rounds, `interval` time units apart:
+#
+#     flap        `scale` links go down and come back up half an interval later, every round
+#     crash       `scale` random nodes crash (DELETE_NODE) and rejoin with their old links half an interval later
+#     partition   `scale` consecutive ring nodes are cut off from the rest, healed half an interval later
+#     cascade     the weights of `scale` links around one node go up by MAX_LATENCY, link after link, every
+#                 round; the classic trigger of count to infinity in distance vector routing
+#
+# Events come out as (time, event type, args...) tuples in time order, like generate_events.
+
+
+def base_topology(rng, n, degree):
+    """Random connected graph on nodes 0..n-1 with about `degree` links per node: {(node1, node2): latency}, node1 < node2."""
+    links = {}
+    for i in range(n):
+        links[tuple(sorted((i, (i + 1) % n)))] = random_weight(rng)
+    window = max(2, n.bit_length())
+    extra = max(0, degree - 2) * n // 2
+    attempts = 20 * extra
+    while extra > 0 and attempts > 0:
+        attempts -= 1
+        a = rng.randrange(n)
+        b = (a + rng.randint(2, window)) % n if rng.random() < 0.5 else rng.randrange(n)
+        link = tuple(sorted((a, b)))
+        if a != b and link not in links:
+            links[link] = random_weight(rng)
+            extra -= 1
+    return links
+
+
+def flap(rng, n, links, start, scale, intensity, interval):
+    chosen = rng.sample(sorted(links), min(scale, len(links)))
+    for i in range(intensity):
+        t = start + i * interval
+        for a, b in chosen:
+            yield (t, "DELETE_LINK", a, b)
+            yield (t + interval // 2, "ADD_LINK", a, b, links[a, b])
+
+
+def crash(rng, n, links, start, scale, intensity, interval):
+    for i in range(intensity):
+        t = start + i * interval
+        victims = set(rng.sample(range(n), min(scale, n)))
+        for node in sorted(victims):
+            yield (t, "DELETE_NODE", node)
+        for node in sorted(victims):
+            yield (t + interval // 2, "ADD_NODE", node)
+        # Every link of a victim comes back, also between two victims
+        for (a, b), latency in links.items():
+            if a in victims or b in victims:
+                yield (t + interval // 2, "ADD_LINK", a, b, latency)
+
+
+def partition(rng, n, links, start, scale, intensity, interval):
+    for i in range(intensity):
+        t = start + i * interval
+        first = rng.randrange(n)
+        inside = {(first + k) % n for k in range(min(scale, n - 1))}
+        cut = [link for link in sorted(links) if (link[0] in inside) != (link[1] in inside)]
+        for a, b in cut:
+            yield (t, "DELETE_LINK", a, b)
+            yield (t + interval // 2, "ADD_LINK", a, b, links[a, b])
+
+
+def cascade(rng, n, links, start, scale, intensity, interval):
+    # Links closest to one node, breadth first from it
+    adj = {}
+    for a, b in links:
+        adj.setdefault(a, []).append(b)
+        adj.setdefault(b, []).append(a)
+    target = rng.randrange(n)
+    chosen, seen, queue = [], {target}, [target]
+    while queue and len(chosen) < scale:
+        node = queue.pop(0)
+        for neighbor in sorted(adj[node]):
+            link = tuple(sorted((node, neighbor)))
+            if link not in chosen and len(chosen) < scale:
+                chosen.append(link)
+            if neighbor not in seen:
+                seen.add(neighbor)
+                queue.append(neighbor)
+
+    spacing = max(1, interval // max(1, len(chosen)))
+    for i in range(intensity):
+        for k, (a, b) in enumerate(chosen):
+            yield (start + i * interval + k * spacing, "CHANGE_LINK", a, b, links[a, b] + (i + 1) * MAX_LATENCY)
+
+
+PATTERNS = {
+    'flap': flap,
+    'crash': crash,
+    'partition': partition,
+    'cascade': cascade
+}
+
+
+def generate_workload(pattern, n, degree, seed=None, scale=None, intensity=3, interval=20 * MAX_LATENCY,
+                      start=50 * MAX_LATENCY):
+    """
+    Yield a stress scenario as (time, event type, args...) tuples, see the comment at the top.
+    scale defaults to 5% of the nodes (at least 1). The same seed always gives the same events.
+    """
+    if pattern not in PATTERNS:
+        raise ValueError("Unknown pattern %s, expected one of %s" % (pattern, ", ".join(PATTERNS)))
+    if n < 3:
+        raise ValueError("A workload needs at least 3 nodes")
+    rng = random.Random(seed)
+    if scale is None:
+        scale = max(1, n // 20)
+
+    links = base_topology(rng, n, degree)
+    for i in range(n):
+        yield (0, "ADD_NODE", i)
+    for (a, b), latency in links.items():
+        yield (1, "ADD_LINK", a, b, latency)
+
+    stress = PATTERNS[pattern](rng, n, links, start, scale, intensity, interval)
+    yield from sorted(stress, key=lambda event: event[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a stress scenario (.event) for Routesim.')
+    parser.add_argument('pattern', choices=PATTERNS)
+    parser.add_argument('--nodes', type=int, default=1000, help='number of nodes')
+    parser.add_argument('--degree', type=int, default=4, help='average links per node')
+    parser.add_argument('--scale', type=int, help='links / nodes affected each round (default 5%% of the nodes)')
+    parser.add_argument('--intensity', type=int, default=3, help='number of rounds')
+    parser.add_argument('--interval', type=int, default=20 * MAX_LATENCY, help='time between rounds')
+    parser.add_argument('--start', type=int, default=50 * MAX_LATENCY, help='time of the first round')
+    parser.add_argument('--seed', type=int, help='random seed, the same seed writes the same file')
+    parser.add_argument('--out', help='output filename prefix (default: the pattern name)')
+    args = parser.parse_args()
+
+    filename = "%s.event" % (args.out or args.pattern)
+    print("writing %s" % filename)
+    for event in tee_events(generate_workload(args.pattern, args.nodes, args.degree, args.seed, args.scale,
+                                              args.intensity, args.interval, args.start), filename):
+        pass
+
+
+if __name__ == '__main__':
+    # Try: python generate_workload.py cascade --nodes 1000 --scale 20 --intensity 5 --seed 1
+    main()
@@ -4,7 +4,8 @@ from simulator.node import Node
 class Generic_Node(Node):
     def __init__(self, id):
         super().__init__(id)
-        self.logging.debug("new node %d" % self.id)
+        if self.sim.trace.node:
+            self.sim.trace.node("new node %d", self.id)
 
     def __str__(self):
         return "A Generic Node: " + str(self.id) + "\n"
@@ -19,10 +20,12 @@ class Generic_Node(Node):
             # self.send_to_neighbors("hello")
             self.send_to_neighbor(neighbor, "hello")
 
-        self.logging.debug('link update, neighbor %d, latency %d, time %d' % (neighbor, latency, self.get_time()))
+        if self.sim.trace.node:
+            self.sim.trace.node('node %d link update, neighbor %d, latency %d, time %d', self.id, neighbor, latency, self.get_time())
 
     def process_incoming_routing_message(self, m):
-        self.logging.debug("receive a message at Time %d. " % self.get_time() + m)
+        if self.sim.trace.node:
+            self.sim.trace.node("node %d receive a message at Time %d. %s", self.id, self.get_time(), m)
 
     # Return a neighbor, -1 if no path to destination
     def get_next_hop(self, destination):
@@ -1,4 +1,5 @@
 from simulator.node import Node
+from simulator.lsdb import Shared_Store
 import json
 import heapq
 
@@ -15,6 +16,9 @@ class Link_State_Node(Node):
         # Links
         self.links = {}
 
+        # Shortest path state for the current graph, see _spf
+        self.spf = None
+
     def __str__(self):
         """
         Return a string with the current node's ID, graph, and links
@@ -43,6 +47,9 @@ class Link_State_Node(Node):
                 # Add link to graph with given latency for other node
                 self.graph[link] = latency
 
+        # Shortest paths have to be computed again
+        self.spf = None
+
         # print("Updated Graph:", self.graph)
 
     def link_has_been_updated(self, neighbor, latency):
@@ -155,41 +162,56 @@ class Link_State_Node(Node):
             # Pass the message along to the node's neighbors
             self.send_to_neighbors(msg)
 
-    # Return a neighbor, -1 if no path to destination
-    def get_next_hop(self, destination):
+    def _spf(self):
         """
-        Get the next hop by implementing Dijkstra's algorithm
-        on the node's current graph
+        Dijkstra's algorithm state for the current graph. Queries settle only as
+        many nodes as they need and the next query resumes where the last one stopped.
+        The state is thrown away whenever the graph changes (see update_graph)
         """
 
-        # Create a list (set) of all nodes in the graph, since the
-        # graph is currently made of links as keys
-        all_nodes = set()
-        for link in self.graph:
+        # Reuse the state if the graph has not changed since it was built
+        if self.spf is not None:
+            return self.spf
 
-            # Parse nodes from link
-            node1, node2 = link
+        # Turn the links into an adjacency dict, so each visit only looks at its own links
+        adjacency = {}
+        for link, latency in self.graph.items():
 
-            # Add each node to link (without repeats since all_nodes is a set)
-            all_nodes.add(node1)
-            all_nodes.add(node2)
-
-        # Initialize the distance to each node to infinity
-        dist = {node: float('inf') for node in all_nodes}
-
-        # Initialize the distance to the starting node to 0
-        dist[self.id] = 0
-
-        # Keep track of the visited nodes and the predecessor of each node in the shortest path
-        visited = set()
-        predecessor = {node: None for node in all_nodes}
+            # Parse nodes from link (a link to itself never shortens a path)
+            if len(link) != 2:
+                continue
+            node1, node2 = link
 
-        # Use a heap to keep track of the nodes to visit next
-        heap = [(0, self.id)] # heap of (total cost, node ID)
-        heapq.heapify(heap)
+            # Add the link in both directions
+            adjacency.setdefault(node1, {})[node2] = latency
+            adjacency.setdefault(node2, {})[node1] = latency
+
+        self.spf = {
+            "adjacency": adjacency,
+            "dist": {self.id: 0},       # best known distance, final once visited
+            "predecessor": {},          # node before each node on its shortest path
+            "next_hop": {},             # first hop towards each visited node
+            "visited": set(),
+            "visit_order": [],
+            "heap": [(0, self.id)]      # heap of (total cost, node ID)
+        }
+        return self.spf
+
+    def _settle(self, destination=None):
+        """
+        Visit nodes until the destination is visited, or all reachable nodes
+        if there is no destination. Returns the Dijkstra state
+        """
+        spf = self._spf()
+        adjacency = spf["adjacency"]
+        dist = spf["dist"]
+        predecessor = spf["predecessor"]
+        next_hop = spf["next_hop"]
+        visited = spf["visited"]
+        heap = spf["heap"]
 
-        # Iterate until we've visited all reachable nodes
-        while heap:
+        # Iterate until the destination (or every reachable node) has been visited
+        while heap and destination not in visited:
 
             # Pop the node with the smallest distance from the heap
             curr_dist, curr_node = heapq.heappop(heap)
@@ -200,58 +222,297 @@ class Link_State_Node(Node):
 
             # Mark the current node as visited
             visited.add(curr_node)
+            spf["visit_order"].append(curr_node)
+
+            # Neighbors are their own next hop, everyone else inherits it from their predecessor
+            if curr_node != self.id:
+                if predecessor[curr_node] == self.id:
+                    next_hop[curr_node] = curr_node
+                else:
+                    next_hop[curr_node] = next_hop[predecessor[curr_node]]
 
             # Update the distances to adjacent nodes
-            for link in self.graph:
+            for neighbor, latency in adjacency.get(curr_node, {}).items():
+
+                # Calculate the new distance to the neighbor
+                new_dist = curr_dist + latency
+
+                # If the new distance to the neighbor is less than previous
+                if new_dist < dist.get(neighbor, float('inf')):
+
+                    # Update the distance to the neighbor
+                    dist[neighbor] = new_dist
+
+                    # Update the neighbor's predecesor
+                    predecessor[neighbor] = curr_node
+
+                    # Push the neighbor onto the heap
+                    heapq.heappush(heap, (new_dist, neighbor))
+
+        return spf
+
+    # Return a neighbor, -1 if no path to destination
+    def get_next_hop(self, destination):
+        """
+        Get the next hop by running Dijkstra's algorithm on the
+        node's current graph, only until the destination is reached
+        """
+
+        # The first hop is recorded when the destination is visited
+        return self._settle(destination)["next_hop"].get(destination, -1)
+
+    def get_routing_table(self):
+        """
+        Next hop and cost to every reachable node, from a single run of Dijkstra's algorithm
+        """
+
+        # Visit every reachable node
+        spf = self._settle()
+
+        # Nodes in the order they were visited, like the full computation reports them
+        return {node: (spf["next_hop"][node], spf["dist"][node])
+                for node in spf["visit_order"] if node != self.id}
+
+
+class Incremental_Link_State_Node(Link_State_Node):
+    """
+    Link state routing that repairs its shortest path tree after each link change
+    instead of running Dijkstra's algorithm again (in the style of Ramalingam and Reps).
+
+    With positive latencies Dijkstra's algorithm visits nodes by (distance, ID), so the
+    predecessor it picks is the tight neighbor with the smallest (distance, ID). The repair
+    uses the same rule, so routes are the same as Link_State_Node's. While some link has
+    latency 0 every change falls back to a full run.
+    """
 
-                # If the current node is on either side of a link
-                if curr_node in link:
+    def __init__(self, id):
+        super().__init__(id)
+
+        # Repaired changes, and the nodes whose distance they computed again
+        self.spf_repairs = 0
+        self.spf_resettled = 0
 
-                    # Get the node's neighbor on the other side of the link
-                    neighbor = set(link - set([curr_node])).pop()
+        # Full runs of Dijkstra's algorithm
+        self.spf_full_runs = 0
+
+    def __str__(self):
+        return super().__str__() + " SPF: %d repairs, %d nodes re-settled, %d full runs" % (
+            self.spf_repairs, self.spf_resettled, self.spf_full_runs)
 
-                    # Get the latency of the link
-                    latency = self.graph[link]
+    def _spf(self):
+        if self.spf is None:
+            spf = super()._spf()
+            spf["zero_links"] = sum(1 for latency in self.graph.values() if latency == 0)
+            self.spf_full_runs += 1
+        return self.spf
 
-                    # Calculate the new distance to the neighbor
-                    new_dist = dist[curr_node] + latency
+    def _settle(self, destination=None):
+        """
+        Always settle every reachable node, so the tree is complete and can be repaired
+        """
+        spf = super()._settle()
+        if "children" not in spf:
+            spf["children"] = {}
+            for node, parent in spf["predecessor"].items():
+                spf["children"].setdefault(parent, set()).add(node)
+        return spf
+
+    def update_graph(self, latency, node1, node2):
 
-                    # If the new distance to the neighbor is less than previous
-                    if new_dist < dist[neighbor]:
+        # Tree before the change (only a complete one can be repaired)
+        spf = self.spf if self.spf is not None and "children" in self.spf else None
+        link = frozenset({node1, node2})
+        old = self.graph.get(link)
+
+        # Change the graph, which throws the tree away
+        super().update_graph(latency, node1, node2)
+        new = self.graph.get(link)
+
+        # Nothing to repair
+        if spf is None or old == new or node1 == node2:
+            self.spf = spf if old == new else None
+            return
+
+        # Keep the adjacency in step with the graph
+        adjacency = spf["adjacency"]
+        if new is None:
+            del adjacency[node1][node2]
+            del adjacency[node2][node1]
+        else:
+            adjacency.setdefault(node1, {})[node2] = new
+            adjacency.setdefault(node2, {})[node1] = new
+        spf["zero_links"] += (new == 0) - (old == 0)
+
+        # Zero latency links break the (distance, ID) visiting order, run Dijkstra again
+        if spf["zero_links"] > 0 or old == 0:
+            return
+
+        # Nodes are now listed by (distance, ID) instead of in visiting order, which is the same thing here
+        self.spf = spf
+        spf["visit_order"] = None
+        if old is not None and (new is None or new > old):
+            changed = self._repair_increase(node1, node2)
+        else:
+            changed = self._repair_decrease(node1, node2, new)
+        self._repair_tree(changed | {node1, node2})
+        self.spf_repairs += 1
+        self.spf_resettled += len(changed)
+        if self.sim.trace.spf:
+            self.sim.trace.spf("node %d SPF repair for link %d-%d: %d nodes re-settled", self.id, node1, node2, len(changed))
+
+    def _subtree(self, root):
+        """
+        The root and every node whose shortest path goes through it
+        """
+        children = self.spf["children"]
+        subtree = [root]
+        for node in subtree:
+            subtree.extend(children.get(node, ()))
+        return subtree
+
+    def _repair_increase(self, node1, node2):
+        """
+        A tree link got longer or went away: only the nodes below it can get further away.
+        Forget their distances and run Dijkstra's algorithm over just those nodes
+        """
+        spf = self.spf
+        adjacency = spf["adjacency"]
+        dist = spf["dist"]
+        predecessor = spf["predecessor"]
+
+        # Find the node below the link, if the link is in the tree at all
+        if predecessor.get(node2) == node1:
+            affected = self._subtree(node2)
+        elif predecessor.get(node1) == node2:
+            affected = self._subtree(node1)
+        else:
+            return set()
+
+        # Forget the distances below the link
+        affected_set = set(affected)
+        for node in affected:
+            del dist[node]
+
+        # Best way into each affected node from the rest of the tree
+        heap = []
+        for node in affected:
+            best = min((dist[neighbor] + latency for neighbor, latency in adjacency.get(node, {}).items()
+                        if neighbor in dist), default=None)
+            if best is not None:
+                heapq.heappush(heap, (best, node))
+
+        # Dijkstra's algorithm over the affected nodes
+        while heap:
+            curr_dist, curr_node = heapq.heappop(heap)
+            if curr_node in dist:
+                continue
+            dist[curr_node] = curr_dist
+            for neighbor, latency in adjacency.get(curr_node, {}).items():
+                if neighbor in affected_set and neighbor not in dist:
+                    heapq.heappush(heap, (curr_dist + latency, neighbor))
 
-                        # Update the distance to the neighbor
-                        dist[neighbor] = new_dist
+        return affected_set
 
-                        # Update the neighbor's predecesor
-                        predecessor[neighbor] = curr_node
+    def _repair_decrease(self, node1, node2, latency):
+        """
+        A link got shorter or was added: spread the shorter distances from its ends
+        """
+        spf = self.spf
+        adjacency = spf["adjacency"]
+        dist = spf["dist"]
+        inf = float('inf')
+
+        # Either end may now offer a shorter path to the other
+        heap = []
+        for a, b in ((node1, node2), (node2, node1)):
+            if a in dist and dist[a] + latency < dist.get(b, inf):
+                heapq.heappush(heap, (dist[a] + latency, b))
+
+        # Dijkstra's algorithm over the nodes that get closer
+        changed = set()
+        while heap:
+            curr_dist, curr_node = heapq.heappop(heap)
+            if curr_dist >= dist.get(curr_node, inf):
+                continue
+            dist[curr_node] = curr_dist
+            changed.add(curr_node)
+            for neighbor, latency in adjacency.get(curr_node, {}).items():
+                if curr_dist + latency < dist.get(neighbor, inf):
+                    heapq.heappush(heap, (curr_dist + latency, neighbor))
 
-                        # Push the neighbor onto the heap
-                        heapq.heappush(heap, (new_dist, neighbor))
+        return changed
 
-        # Build the path from start to end by following the predecessor links
-        path = []
-        curr_node = destination
+    def _repair_tree(self, changed):
+        """
+        Pick predecessors again around the nodes whose distance changed, then
+        hand the new next hops down to the nodes below them
+        """
+        spf = self.spf
+        adjacency = spf["adjacency"]
+        dist = spf["dist"]
+        predecessor = spf["predecessor"]
+        next_hop = spf["next_hop"]
+        children = spf["children"]
+
+        # Their neighbors may gain or lose a tight link to them
+        around = set(changed)
+        for node in changed:
+            around.update(adjacency.get(node, ()))
+        around.discard(self.id)
+
+        # Predecessor: the tight neighbor with the smallest (distance, ID)
+        moved = []
+        for node in around:
+            if node in dist:
+                parent = min((dist[neighbor], neighbor) for neighbor, latency in adjacency[node].items()
+                             if neighbor in dist and dist[neighbor] + latency == dist[node])[1]
+            else:
+                parent = None
+            if predecessor.get(node) != parent:
+                if node in predecessor:
+                    children[predecessor.pop(node)].discard(node)
+                if parent is not None:
+                    predecessor[node] = parent
+                    children.setdefault(parent, set()).add(node)
+                moved.append(node)
+
+        # Nodes that became unreachable
+        for node in moved:
+            if node not in dist:
+                next_hop.pop(node, None)
+
+        # Next hops of the moved nodes and everything below them, parents first
+        below = set()
+        for node in moved:
+            if node in dist and node not in below:
+                below.update(self._subtree(node))
+        for node in sorted(below, key=lambda node: (dist[node], node)):
+            if predecessor[node] == self.id:
+                next_hop[node] = node
+            else:
+                next_hop[node] = next_hop[predecessor[node]]
 
-        # print()
-        # print(self.graph)
-        # print()
-        # print(self.links)
-        # print()
+    def get_routing_table(self):
+        """
+        Next hop and cost to every reachable node, in the order Dijkstra's algorithm visits them
+        """
+        spf = self._settle()
+        if spf["visit_order"] is not None:
+            return super().get_routing_table()
+        return {node: (spf["next_hop"][node], spf["dist"][node])
+                for node in sorted(spf["predecessor"], key=lambda node: (spf["dist"][node], node))}
 
-        while curr_node is not None:
-            path.append(curr_node)
-            # print(self.graph)
-            # print('Node', self.id, 'w/ Pred:', predecessor[curr_node])
-            # print()
-            curr_node = predecessor[curr_node]
 
-        # Reverse path so that it goes source -> destination
-        path = path[::-1]
+class Shared_Link_State_Node(Link_State_Node):
+    """
+    Link state routing where the nodes of a simulation share one copy-on-write
+    database (simulator/lsdb.py): self.graph and self.links only keep what
+    this node sees differently from the rest. The protocol is unchanged
+    """
 
-        # If we didn't reach the end node, there's no path
-        if path[0] != self.id:
-            return -1
+    def __init__(self, id):
+        super().__init__(id)
 
-        # Return the next hop in the path
-        next_hop = path[1]
-        return next_hop
+        # Views on the databases shared by every node of this simulation
+        self.graph = self.sim.shared("lsdb.graph", Shared_Store).view()
+        self.links = self.sim.shared("lsdb.links", Shared_Store).view()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import tracemalloc
+
+from simulator.config import EVENT_TYPE
+from simulator.topology import Topology
+
+
+class Legacy_Event:
+    """
+    The Event class before __slots__, for --legacy: a __dict__ per event holding the time stamp,
+    the event type, the simulation and three arguments, nothing else.
+    """
+
+    def __init__(self, time_stamp, event_type, sim, arg1 = -1, arg2 = -1, arg3 = -1):
+        self.time_stamp = time_stamp
+        self.event_type = event_type
+        self.sim = sim
+
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.arg3 = arg3
+
+    def __lt__(self, other):
+        if self.time_stamp == other.time_stamp:
+            if self.event_type != EVENT_TYPE.SEND_LINK and other.event_type == EVENT_TYPE.SEND_LINK:
+                return True
+        return self.time_stamp < other.time_stamp
+
+
+def legacy_queue(topology):
+    """
+    The pending events of `topology` as they used to be stored: Legacy_Events whose payloads are
+    not interned, so every sender keeps its own copy of an equal advertisement.
+    """
+    payloads = {}
+    events = []
+    for e in topology.event_queue:
+        payload = payloads.get(e.sender)
+        if payload is None:
+            # A new string object with the same text, as json.dumps returned before interning
+            payload = payloads[e.sender] = (e.arg2 + ' ')[:-1]
+        events.append(Legacy_Event(e.time_stamp, e.event_type, topology, e.arg1, payload))
+    return events
+
+
+def flood(nodes, degree):
+    """
+    Fill the queue like one round of link state flooding: every node sends the same
+    advertisement to all of its neighbors. Returns the topology with the messages pending.
+    """
+    topology = Topology('GENERIC', 'NO_STOP')
+    for node in range(nodes):
+        for step in range(1, degree // 2 + 1):
+            topology.add_link(node, (node + step) % nodes, 1 + (node + step) % 10)
+    # Leave only the routing messages in the queue
+    topology.event_queue.Load([])
+
+    pending = 0
+    for node in range(nodes):
+        # Every receiver of the flood forwards an equal, but separately encoded, copy
+        advertisement = json.dumps({"src": node % degree, "dst": (node + 1) % degree, "lat": 1, "seq": 0})
+        topology.send_to_neighbors(node, advertisement)
+        pending += degree
+    return topology, pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the memory taken by pending routing messages.')
+    parser.add_argument('--nodes', type=int, default=100000, help='number of nodes in the ring lattice')
+    parser.add_argument('--degree', type=int, default=10, help='links per node (even)')
+    parser.add_argument('--legacy', action='store_true',
+                        help='measure the pending events in the old representation (unslotted, not interned)')
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    topology, pending = flood(args.nodes, args.degree)
+    if args.legacy:
+        topology.event_queue.Load(legacy_queue(topology))
+    links = tracemalloc.get_traced_memory()[0]
+    topology.event_queue.Load([])
+    empty = tracemalloc.get_traced_memory()[0]
+
+    print("Pending events: %d%s" % (pending, " (legacy representation)" if args.legacy else ""))
+    print("Bytes per pending event: %.1f" % ((links - empty) / pending))
+    print("Total traced: %.1f MB (topology %.1f MB)" % ((links - before) / 2 ** 20, (empty - before) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    # Try: python memory_benchmark.py --nodes 100000 --degree 10
+    #      python memory_benchmark.py --nodes 100000 --degree 10 --legacy
+    main()
@@ -1,57 +1,421 @@
+import os
 import sys
+import time
+import shutil
+import asyncio
+import argparse
 import logging
+import tempfile
 
 from simulator.config import *
-from simulator.topology import Topology, Get_Time
-from simulator.event_queue import Event_Queue
+from simulator.topology import Topology
+from simulator.recorder import Event_Recorder, TOPOLOGY_CHANGES
+from simulator.watchdog import Run_Limits, Watchdog
+from simulator.metrics import Metrics
+from simulator.tracing import Trace_Flags, TRACE_CATEGORIES
+from simulator.parallel import Partition_Pool, Remote_Node, partition_nodes, lookahead
+from simulator.event import Event
+from simulator.event_queue import Ranked_Event_Queue
+from simulator.render import Background_Renderer
+from simulator.emulation import Node_Hosting, Emulation_Pool, percentiles, convergence
 
 
 class Sim(Topology):
 
-    def __init__(self, algorithm, event_file, step='NORMAL'):
-        super().__init__(algorithm, step)
-        self.load_command_file(event_file)
+    def __init__(self, algorithm, event_file, step='NORMAL', record=None, export=None, limits=None, metrics=None,
+                 trace=None):
+        # event_file may also be an iterable of events, see generate_simulation.generate_events
+        # limits defaults to the MAX_* values in simulator/config.py; stopped says why a limit ended the run
+        # metrics is a simulator.metrics.Metrics to publish live counters through
+        # trace is a simulator.tracing.Trace_Flags, no tracing by default
+        super().__init__(algorithm, step, trace)
+        self.record = record
+        self.recorder = None
+        if limits is None:
+            limits = Run_Limits()
+        self.watchdog = Watchdog(limits) if limits.active() else None
+        self.stopped = None
+        self.metrics = metrics
+        self.load(event_file)
+        if record is not None:
+            self.recorder = Event_Recorder(record, self.scenario, algorithm)
+        if metrics is not None:
+            metrics.start_run(self)
         self.dump_sim()
-        self.dispatch_event(self.step)
+        try:
+            self.dispatch_event(self.step)
+            if export is not None:
+                self.export_routes(export)
+        finally:
+            self.close()
+            self.close_renderer()
+        if self.traffic is not None:
+            self.logging.info(self.traffic.report())
         self.logging.info("Total messages sent: %d" % self.message_count)
 
     def __str__(self):
         ans = "==== Print Topology ====\n"
         ans += super().__str__()
         ans += "==== Print Event ====\n"
-        ans += Event_Queue.Str()
+        ans += self.event_queue.Str(DUMP_SIM_MAX_EVENTS)
         return ans
 
     def dump_sim(self):
-        self.logging.info("DUMP_SIM at Time %d\n" % Get_Time() + str(self))
+        if self.logging.isEnabledFor(logging.INFO):
+            self.logging.info("DUMP_SIM at Time %d\n" % self.get_time() + str(self))
 
     def dispatch_event(self, step='NORMAL'):
-        e = Event_Queue.Get_Earliest()
+        record = None if self.recorder is None else self.recorder.record
+        check = None if self.watchdog is None else self.watchdog.check
+        tick = None if self.metrics is None else self.metrics.tick
+        e = self.event_queue.Get_Earliest()
         while e:
-            e.dispatch()
+            if check is not None and check(e, self.event_queue):
+                self.stop(e)
+                break
+            e.dispatch(self)
+            if record is not None:
+                record(e)
+            if tick is not None:
+                tick(e)
             if step == 'SINGLE_STEP':
                 self.logging.info(str(e))
                 self.wait()
-            e = Event_Queue.Get_Earliest()
+            e = self.event_queue.Get_Earliest()
+
+    def stop(self, e):
+        # A run limit was crossed before dispatching e: leave it waiting and report the busiest senders
+        self.event_queue.Post(e)
+        self.event_queue.Current_Time = self.watchdog.last_time
+        self.stopped = self.watchdog.reason
+        self.logging.warning(self.watchdog.report(self.event_queue))
+
+    def queue_depth(self):
+        return len(self.event_queue)
+
+    def close(self):
+        # End of run, whether it finished or failed
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.logging.info("Recorded %d events to %s" % (self.recorder.count, self.record))
 
     def print_comment(self, comment):
-        self.logging.info('Time: %d, Comment: %s' % (Get_Time(), comment))
+        self.logging.info('Time: %d, Comment: %s' % (self.get_time(), comment))
 
 
-def main():
-    if len(sys.argv) < 3 or len(sys.argv) > 4 or sys.argv[1] not in ROUTE_ALGORITHM:
-        sys.stderr.write(USAGE_STR)
-        sys.exit(-1)
-
-    step = 'NO_STOP'
-    if len(sys.argv) == 4:
-        if sys.argv[3] not in STEP_COMMAND:
-            sys.stderr.write(USAGE_STR)
-            sys.exit(-1)
+class Partitioned_Sim(Sim):
+    """
+    Runs the nodes in `workers` processes, see simulator/parallel.py.
+    Events sharing a time stamp run in the fixed order of Event.key, so the run is the same as Sim
+    whatever the number of workers, also when it falls back to one process because the event file
+    leaves no lookahead.
+    """
+
+    def __init__(self, algorithm, event_file, step='NORMAL', workers=2, record=None, export=None, limits=None,
+                 metrics=None, trace=None):
+        # Every worker loads the events too, so a generated stream is only read once
+        if not isinstance(event_file, str):
+            event_file = list(event_file)
+        self.algorithm = algorithm
+        self.event_file = event_file
+        self.workers = workers
+        self.pool = None
+        super().__init__(algorithm, event_file, step, record, export, limits, metrics, trace)
+
+    def __str__(self):
+        ans = super().__str__()
+        if self.pool is not None:
+            ans += self.pool.queue_str()
+        return ans
+
+    def create_node(self, node):
+        if self.pool is None:
+            return super().create_node(node)
+        return Remote_Node(self, node)
+
+    def dispatch_event(self, step='NORMAL'):
+        self.event_queue = Ranked_Event_Queue(self.event_queue)
+        window = lookahead(self.event_queue)
+        traffic = any(e.event_type == EVENT_TYPE.SEND_TRAFFIC for e in self.event_queue)
+        if window <= 0 or step == 'SINGLE_STEP' or self.watchdog is not None or traffic:
+            self.logging.warning("Cannot partition this run (zero latency link, SINGLE_STEP, run limits or traffic), running sequentially")
+            return super().dispatch_event(step)
+
+        # Workers record and count the routing messages, the coordinator everything it replays itself
+        record = None if self.recorder is None else self.recorder.record
+        tick = None if self.metrics is None else self.metrics.tick
+        self.pool = Partition_Pool(self.algorithm, self.event_file,
+                                   partition_nodes(self.event_queue, self.workers), self.workers, self.record,
+                                   self.trace.settings())
+        while True:
+            times = [t for t in (self.pool.next_time(), self.next_time()) if t is not None]
+            if times == []:
+                break
+            bound = (min(times) + window,)
+
+            # Replay topology events on the coordinator, the window ends early at an observation
+            head = self.event_queue.Peek()
+            while head is not None and head.key < bound:
+                if head.event_type in OBSERVATION_EVENTS:
+                    bound = head.key
+                    break
+                e = self.event_queue.Get_Earliest()
+                e.dispatch(self)
+                if record is not None:
+                    record(e)
+                if tick is not None:
+                    tick(e)
+                head = self.event_queue.Peek()
+
+            delivered = self.pool.message_count()
+            self.pool.run(bound)
+            # The clock of a sequential run would be at the last message the workers delivered
+            self.event_queue.Current_Time = max(self.get_time(), self.pool.time())
+            if self.metrics is not None:
+                self.metrics.add(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL, self.pool.message_count() - delivered)
+            self.forget_routes()
+            if head is not None and head.key == bound:
+                e = self.event_queue.Get_Earliest()
+                e.dispatch(self)
+                if record is not None:
+                    record(e)
+                if tick is not None:
+                    tick(e)
+
+    def close(self):
+        # The workers stay up until here so an end of run export can still ask them
+        if self.pool is not None:
+            self.message_count = self.pool.close()
+            if self.recorder is not None:
+                for part in self.pool.recordings():
+                    self.recorder.append(part)
+                    os.remove(part)
+        super().close()
+
+    def next_time(self):
+        head = self.event_queue.Peek()
+        return None if head is None else head.time_stamp
+
+    def queue_depth(self):
+        # Including the routing messages the workers had waiting after the last window
+        return super().queue_depth() + (0 if self.pool is None else self.pool.queue_depth())
+
+
+class Emulated_Sim(Node_Hosting, Sim):
+    """
+    Runs the scenario in wall clock time, one simulated time unit per `scale` seconds, with every
+    node behind its own Unix socket and asyncio task, in this process or in `workers` processes,
+    see simulator/emulation.py. get_time() is the elapsed time in time units. Logs throughput,
+    callback times, delivery lag and convergence.
+    """
+
+    def __init__(self, algorithm, event_file, scale=EMULATION_SCALE, workers=1, record=None, export=None,
+                 metrics=None, trace=None):
+        self.init_hosting(scale)
+        self.algorithm = algorithm
+        self.workers = workers
+        self.pool = None
+        # (busy, sent, received, last callback, messages, waiting) of the workers as of the last poll
+        self.pool_status = None
+        # (scenario time, wall time) of the first topology change at each scenario time
+        self.changes = []
+        super().__init__(algorithm, event_file, 'NO_STOP', record, export, Run_Limits(None, None, None, None), metrics,
+                         trace)
+
+    def hosted(self, node):
+        return self.pool is None and super().hosted(node)
+
+    def create_node(self, node):
+        if self.pool is None:
+            return super().create_node(node)
+        return Remote_Node(self, node)
+
+    async def run(self):
+        record = None if self.recorder is None else self.recorder.record
+        tick = None if self.metrics is None else self.metrics.tick
+        self.start = time.monotonic()
+        if self.pool is not None:
+            self.pool.start(self.start)
+            poll = asyncio.get_running_loop().create_task(self.poll())
+        try:
+            await self.emulate(record, tick)
+        finally:
+            if self.pool is not None:
+                poll.cancel()
+            self.close_channels()
+            await self.close_hosts()
+
+    async def emulate(self, record, tick):
+        e = self.event_queue.Get_Earliest()
+        while e and self.failure is None:
+            delay = self.start + e.time_stamp * self.scale - time.monotonic()
+            if delay > 0:
+                if self.pool is not None:
+                    self.pool.flush()
+                await asyncio.sleep(delay)
+            e.dispatch(self)
+            if self.pool is not None and e.event_type not in OBSERVATION_EVENTS:
+                self.pool.post(e)
+            if e.event_type in TOPOLOGY_CHANGES and (not self.changes or self.changes[-1][0] != e.time_stamp):
+                self.changes.append((e.time_stamp, time.monotonic()))
+            if record is not None:
+                record(e)
+            if tick is not None:
+                tick(e)
+            head = self.event_queue.Peek()
+            if head is None or head.time_stamp != e.time_stamp:
+                self.flush_link_updates()
+            # Let new hosts start and link updates run
+            await asyncio.sleep(0)
+            e = self.event_queue.Get_Earliest()
+        if self.pool is not None:
+            self.pool.flush()
+
+        # Wait for the network to go quiet
+        while self.failure is None and not self.quiet():
+            await asyncio.sleep(EMULATION_QUIET / 10)
+
+    async def poll(self):
+        # Worker progress for the metrics, and worker failures, while the run goes on
+        while True:
+            await asyncio.sleep(EMULATION_QUIET / 10)
+            self.poll_workers()
+
+    def poll_workers(self):
+        try:
+            self.pool_status = self.pool.status()
+        except RuntimeError as e:
+            self.failure = e
+            return
+        if self.metrics is not None:
+            self.metrics.add(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL, self.pool_status[4] - self.message_count)
+        self.message_count = self.pool_status[4]
+
+    def quiet(self):
+        if self.pool is None:
+            busy, sent, received, last_callback = self.hosting_status()[:4]
         else:
-            step = sys.argv[3]
+            self.poll_workers()
+            if self.failure is not None:
+                return True
+            busy, sent, received, last_callback = self.pool_status[:4]
+        return not busy and sent == received and time.monotonic() - last_callback >= EMULATION_QUIET
+
+    def dispatch_event(self, step='NORMAL'):
+        # The drawing process has to start before any socket exists, a fork would keep connections open
+        draws = (EVENT_TYPE.DRAW_TOPOLOGY, EVENT_TYPE.DRAW_PATH, EVENT_TYPE.DRAW_TREE)
+        if self.renderer is None and any(e.event_type in draws for e in self.event_queue):
+            self.renderer = Background_Renderer()
+        self.socket_dir = tempfile.mkdtemp(prefix='routesim-')
+        try:
+            if self.workers > 1:
+                if any(e.event_type == EVENT_TYPE.SEND_TRAFFIC for e in self.event_queue):
+                    self.logging.warning("Traffic needs the nodes in one process, SEND_TRAFFIC is ignored with --workers")
+                    self.event_queue.Load([e for e in self.event_queue if e.event_type != EVENT_TYPE.SEND_TRAFFIC])
+                self.pool = Emulation_Pool(self.algorithm, self.scenario, partition_nodes(self.event_queue, self.workers),
+                                           self.workers, self.scale, self.socket_dir, self.record, self.trace.settings())
+            asyncio.run(self.run())
+            if self.pool is not None:
+                self.callback_times, self.lags, self.message_times, self.message_count, self.dropped = self.pool.finish()
+        finally:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+        if self.failure is not None:
+            raise self.failure
+        self.report()
+
+    def close(self):
+        # The workers stay up until here so an end of run export can still ask them
+        if self.pool is not None:
+            self.pool.close()
+            if self.recorder is not None:
+                for part in self.pool.recordings():
+                    self.recorder.append(part)
+                    os.remove(part)
+        super().close()
+
+    def report(self):
+        # Wall clock results; times in milliseconds, convergence in time units
+        wall = max(self.last_callback, self.message_times[-1] if self.message_times else 0,
+                   self.changes[-1][1] if self.changes else 0) - self.start
+        ans = "Emulation at %g s per time unit, %d process(es): %d messages in %.2f s, %.1f messages/s, %d dropped\n" % (
+            self.scale, max(1, self.workers), self.message_count, wall, self.message_count / max(wall, 1e-9), self.dropped)
+        ans += "Callback time (ms, mean / p50 / p99 / max): %.3f / %.3f / %.3f / %.3f\n" % tuple(
+            1000 * t for t in percentiles(self.callback_times))
+        ans += "Delivery lag behind link latency (ms, mean / p50 / p99 / max): %.3f / %.3f / %.3f / %.3f\n" % tuple(
+            1000 * t for t in percentiles(self.lags))
+        ans += "Convergence (change time, messages, convergence time):\n"
+        timeline = convergence([wall_time for _, wall_time in self.changes], self.message_times)
+        for (t, _), (_, messages, took) in zip(self.changes, timeline):
+            if took is None:
+                ans += "    %d: 0, -\n" % t
+            else:
+                ans += "    %d: %d, %.1f\n" % (t, messages, took / self.scale)
+        self.logging.info(ans)
+
+    def queue_depth(self):
+        waiting = self.waiting() if self.pool_status is None else self.pool_status[5]
+        return super().queue_depth() + waiting
+
+
+def positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("%s is not a positive integer" % text)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Routing simulator.')
+    parser.add_argument('algorithm', choices=ROUTE_ALGORITHM, help='route algorithm')
+    parser.add_argument('event', help='event file')
+    parser.add_argument('step', nargs='?', choices=STEP_COMMAND, default='NO_STOP', help='step option')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='split the nodes across this many processes (same results as one)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='write every dispatched event to this binary file, see analyze_recording.py')
+    parser.add_argument('--export', metavar='FILE',
+                        help='write all routing tables and the shortest distances at the end (.npz, or .csv)')
+    parser.add_argument('--max-time', type=int, default=MAX_TIME, help='stop before any event after this time')
+    parser.add_argument('--max-events', type=int, default=MAX_EVENTS, help='stop after dispatching this many events')
+    parser.add_argument('--max-messages-per-second', type=int, default=MAX_MESSAGES_PER_SECOND,
+                        help='stop when more routing messages than this arrive with one time stamp')
+    parser.add_argument('--max-queue-depth', type=int, default=MAX_QUEUE_DEPTH,
+                        help='stop when more events than this are waiting')
+    parser.add_argument('--trace', metavar='CATEGORIES', default=','.join(TRACE_ENABLED),
+                        help='comma separated trace categories to log (%s, or all)' % ', '.join(TRACE_CATEGORIES))
+    parser.add_argument('--trace-sample', type=positive_int, default=TRACE_SAMPLE, metavar='N',
+                        help='log only every Nth trace of each category')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='serve live counters in Prometheus text format on this local port (0 picks one)')
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help='rewrite this file with the same counters every %d seconds' % METRICS_INTERVAL)
+    parser.add_argument('--emulate', type=float, metavar='SCALE',
+                        help='run in wall clock time, SCALE seconds per time unit, every node on its own socket')
+    args = parser.parse_args()
 
-    s = Sim(sys.argv[1], sys.argv[2], step)
+    try:
+        trace = Trace_Flags([category for category in args.trace.split(',') if category], args.trace_sample)
+    except ValueError as e:
+        parser.error(str(e))
+    limits = Run_Limits(args.max_time, args.max_events, args.max_messages_per_second, args.max_queue_depth)
+    if args.emulate is not None and (args.emulate <= 0 or limits.active()):
+        parser.error('--emulate needs a positive SCALE and runs without --max-* limits')
+    metrics = None
+    if args.metrics_port is not None or args.metrics_file is not None:
+        metrics = Metrics(args.metrics_port, args.metrics_file)
+    if args.emulate is not None:
+        s = Emulated_Sim(args.algorithm, args.event, args.emulate, args.workers, args.record, args.export, metrics,
+                         trace)
+    elif args.workers > 1:
+        s = Partitioned_Sim(args.algorithm, args.event, args.step, args.workers, args.record, args.export, limits,
+                            metrics, trace)
+    else:
+        s = Sim(args.algorithm, args.event, args.step, args.record, args.export, limits, metrics, trace)
+    if s.stopped is not None:
+        # So that batch scripts notice
+        sys.exit(1)
 
 
 if __name__ == '__main__':
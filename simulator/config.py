@@ -1,11 +1,15 @@
 from generic_node import Generic_Node
 from distance_vector_node import Distance_Vector_Node
-from link_state_node import Link_State_Node
+from dense_distance_vector_node import Dense_Distance_Vector_Node
+from link_state_node import Link_State_Node, Incremental_Link_State_Node, Shared_Link_State_Node
 
 ROUTE_ALGORITHM = [
     "GENERIC",
     "DISTANCE_VECTOR",
-    "LINK_STATE"
+    "DISTANCE_VECTOR_DENSE",
+    "LINK_STATE",
+    "LINK_STATE_INCREMENTAL",
+    "LINK_STATE_SHARED"
 ]
 
 STEP_COMMAND = [
@@ -17,7 +21,10 @@ STEP_COMMAND = [
 ROUTE_ALGORITHM_NODE = {
     "GENERIC" : Generic_Node,
     "DISTANCE_VECTOR" : Distance_Vector_Node,
-    "LINK_STATE" : Link_State_Node
+    "DISTANCE_VECTOR_DENSE" : Dense_Distance_Vector_Node,
+    "LINK_STATE" : Link_State_Node,
+    "LINK_STATE_INCREMENTAL" : Incremental_Link_State_Node,
+    "LINK_STATE_SHARED" : Shared_Link_State_Node
 }
 
 class EVENT_TYPE:
@@ -35,18 +42,95 @@ class EVENT_TYPE:
     DRAW_TREE = "DRAW_TREE"
     DUMP_NODE = "DUMP_NODE"
     DUMP_SIM = "DUMP_SIM"
+    EXPORT_ROUTES = "EXPORT_ROUTES"
+    SEND_TRAFFIC = "SEND_TRAFFIC"
 
     # Not for user
     ROUTING_MESSAGE_ARRIVAL = "ROUTING_MESSAGE_ARRIVAL"
     SEND_LINK = "SEND_LINK"
+    INJECT_TRAFFIC = "INJECT_TRAFFIC"
+    DATA_PACKET_ARRIVAL = "DATA_PACKET_ARRIVAL"
+
+
+# Order of events that share a time stamp (Event.key), lowest first: event file commands, routing
+# messages, then SEND_LINK, data packets last.
+EVENT_RANK = {
+    EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL: 1,
+    EVENT_TYPE.SEND_LINK: 2,
+    EVENT_TYPE.INJECT_TRAFFIC: 3,
+    EVENT_TYPE.DATA_PACKET_ARRIVAL: 3
+}
+
+# Link commands that take an optional fourth argument, the link's bandwidth in bytes per time unit
+BANDWIDTH_EVENTS = [
+    EVENT_TYPE.ADD_LINK,
+    EVENT_TYPE.CHANGE_LINK
+]
+
+# Events that only look at the simulation. The partitioned engine runs them on the coordinator.
+OBSERVATION_EVENTS = [
+    EVENT_TYPE.PRINT,
+    EVENT_TYPE.DRAW_TOPOLOGY,
+    EVENT_TYPE.DRAW_PATH,
+    EVENT_TYPE.DRAW_TREE,
+    EVENT_TYPE.DUMP_NODE,
+    EVENT_TYPE.DUMP_SIM,
+    EVENT_TYPE.EXPORT_ROUTES
+]
 
 
 OUTPUT_PATH = "output/"
 
-USAGE_STR = "usage: sim.py route_algorithm event [step=NORMAL]\n" \
-            "\troute_algorithm\t- {GENERIC DISTANCE_VECTOR LINK_STATE}\n" \
-            "\tevent\t\t\t- a file\n" \
-            "\tstep\t\t\t- {NORMAL SINGLE_STEP NO_STOP}"
+# Parsed event files are kept next to the source as <file>.bin, see simulator/event_cache.py
+COMPILED_EVENT_SUFFIX = ".bin"
+
+# NO_STOP runs draw in a background process, see simulator/render.py.
+# When RENDER_QUEUE_SIZE drawings are waiting, further ones are skipped ('drop') or the simulation waits ('block').
+RENDER_QUEUE_SIZE = 16
+RENDER_POLICY = 'drop'
+# Seconds the end of a run waits for the drawing process to finish the queued drawings
+RENDER_TIMEOUT = 60
+# Seconds between checks that the drawing process is still alive while waiting for it
+RENDER_POLL = 1
+
+# Drawings reuse the previous layout and only refine it this much when nodes change
+LAYOUT_REFINE_ITERATIONS = 10
+LAYOUT_CACHE_PATH = OUTPUT_PATH + "layout_cache/"
+# Layouts kept in the cache, the least recently used ones are deleted beyond that
+LAYOUT_CACHE_SIZE = 500
+
+# Run limits, None for no limit, see simulator/watchdog.py. sim.py --max-* sets them per run.
+MAX_TIME = None
+MAX_EVENTS = None
+MAX_MESSAGES_PER_SECOND = None
+MAX_QUEUE_DEPTH = None
+# Nodes and links listed when a run is stopped
+LIMIT_REPORT_TOP = 5
+
+# Trace categories sim.py turns on (simulator/tracing.py lists them), --trace overrides it
+TRACE_ENABLED = ()
+# Emit 1 in this many calls of each enabled category
+TRACE_SAMPLE = 1
+
+# sim.py --metrics-port / --metrics-file: sample and rewrite the file every METRICS_INTERVAL seconds (wall time)
+METRICS_INTERVAL = 5
+METRICS_HOST = '127.0.0.1'
+
+# sweep.py keeps one result file per finished cell here
+SWEEP_CACHE_PATH = OUTPUT_PATH + "sweep_cache/"
+
+# sim.py --emulate: seconds per simulated time unit, and how long the network has to be idle at the end
+EMULATION_SCALE = 0.01
+EMULATION_QUIET = 0.5
+
+# SEND_TRAFFIC (simulator/traffic.py): time units between the packet batches of a flow, hops before a
+# packet counts as looped, and the width of the time buckets in the traffic report
+TRAFFIC_INTERVAL = 1
+TRAFFIC_TTL = 64
+TRAFFIC_BUCKET = 100
+
+# DUMP_SIM (also logged once at the start of every run) lists at most this many waiting events, None for all
+DUMP_SIM_MAX_EVENTS = 1000
 
 
 LOGGING_FORMAT = "[%(asctime)s][%(levelname)s] %(name)s: %(message)s"
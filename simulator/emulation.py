@@ -0,0 +1,500 @@
+import os
+import time
+import socket
+import struct
+import asyncio
+import logging
+import traceback
+import multiprocessing
+
+from simulator.config import *
+from simulator.event import Event
+from simulator.topology import Topology
+from simulator.recorder import Event_Recorder
+from simulator.tracing import Trace_Flags
+
+
+# Wall clock emulation (sim.py --emulate SCALE, Emulated_Sim).
+#
+# The same node classes and event files, but in real time: one simulated time unit lasts SCALE
+# seconds, event file commands run when their time comes, and every node is served by a
+# Node_Host: a Unix stream socket for its incoming messages and an asyncio task that hands the
+# node one callback (link update or message) at a time, in arrival order.
+#
+# A message sent over a link with latency L leaves L * SCALE seconds later, through a Channel
+# (one connection per sender and receiver) to the receiver's socket. Each frame is
+#
+#     sender (int64), payload length (uint32), due (float64, time.monotonic() the message should arrive), payload (UTF-8)
+#
+# so the receiver can tell how far behind the link latency it got to the message. Link updates
+# wait until every command of their time stamp ran, as SEND_LINK events do in a simulation, so a
+# node that sends to its neighbors from link_has_been_updated sees all of them. A socket is
+# named after the node id and how often the node was added, so a node that crashed and came
+# back does not get the messages still on their way to its old self.
+#
+# With --workers N the nodes are split over N worker processes (Emulation_Pool), each with its
+# own event loop, so node callbacks run on N cores. Messages between workers take the same
+# sockets. The coordinator keeps the clock (a shared time.monotonic() start) and the event file:
+# it sends every topology command to all workers, batched per time stamp, the same way the
+# partitioned simulation replays them (simulator/parallel.py), and asks the owning worker for
+# node state on observation events. A run is over when no worker has work left, every frame
+# sent was received and no callback ran for EMULATION_QUIET seconds.
+
+FRAME = struct.Struct('<qId')
+
+
+def frame(sender, m, due):
+    payload = m.encode()
+    return FRAME.pack(sender, len(payload), due) + payload
+
+
+class Node_Host:
+    """One node's socket and callback task. Items in inbox: ('link', neighbor, latency) or ('message', sender, m, due)."""
+
+    def __init__(self, emulation, node, path):
+        self.emulation = emulation
+        self.node = node
+        self.path = path
+        self.inbox = asyncio.Queue()
+        # Listening right away, so senders can connect before the server task first runs
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+        self.server = None
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self.serve()), loop.create_task(self.work())]
+
+    async def serve(self):
+        self.server = await asyncio.start_unix_server(self.receive, sock=self.sock)
+
+    async def receive(self, reader, writer):
+        # One per incoming Channel, until the sender closes it
+        self.emulation.connections += 1
+        try:
+            while True:
+                sender, length, due = FRAME.unpack(await reader.readexactly(FRAME.size))
+                m = (await reader.readexactly(length)).decode()
+                self.emulation.received += 1
+                self.inbox.put_nowait(('message', sender, m, due))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.emulation.connections -= 1
+            writer.close()
+
+    async def work(self):
+        while True:
+            item = await self.inbox.get()
+            self.emulation.run_callback(self, item)
+
+    def busy(self):
+        return not self.inbox.empty()
+
+    def close(self):
+        # Open connections stay until their senders close them
+        for task in self.tasks:
+            task.cancel()
+        if self.server is not None:
+            self.server.close()
+        else:
+            self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class Channel:
+    """Messages from one node to one socket, in sending order over a single connection."""
+
+    def __init__(self, emulation, path):
+        self.emulation = emulation
+        self.path = path
+        self.writer = None
+        self.backlog = []
+        asyncio.get_running_loop().create_task(self.connect())
+
+    async def connect(self):
+        try:
+            _, self.writer = await asyncio.open_unix_connection(self.path)
+        except OSError:
+            # The receiver went away before we got through
+            self.emulation.dropped += len(self.backlog)
+            self.backlog = []
+            return
+        if self.backlog is None:
+            # Closed while connecting
+            self.writer.close()
+            return
+        for data in self.backlog:
+            self.writer.write(data)
+        self.emulation.sent += len(self.backlog)
+        self.backlog = None
+
+    def send(self, data):
+        if self.writer is not None:
+            self.writer.write(data)
+            self.emulation.sent += 1
+        elif self.backlog is not None:
+            self.backlog.append(data)
+        else:
+            self.emulation.dropped += 1
+
+    def busy(self):
+        # Frames written are counted as sent, the receiver counts them again on arrival
+        return bool(self.backlog)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.backlog = None
+
+
+class Node_Hosting:
+    """
+    Wall clock hosting for a Topology subclass: a Node_Host per node it hosts, messages wait out
+    their link latency on the event loop and then go to the receiver's socket. Call init_hosting()
+    in the constructor and set socket_dir and start before the first event.
+    """
+
+    def init_hosting(self, scale):
+        self.scale = scale
+        self.socket_dir = None
+        self.start = None
+        self.hosts = {}
+        self.channels = {}
+        # Nodes present, and how often each was added, see socket_path()
+        self.live = set()
+        self.generations = {}
+        # Messages waiting for their link latency; frames written and read; messages lost to a node that went away
+        self.scheduled = 0
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.connections = 0
+        self.last_callback = 0
+        self.callback_times = []
+        self.lags = []
+        self.message_times = []
+        self.failure = None
+        # (node, neighbor, latency) of the time stamp whose commands are running, see flush_link_updates
+        self.link_updates = []
+
+    def get_time(self):
+        if self.start is None:
+            return super().get_time()
+        return int((time.monotonic() - self.start) / self.scale)
+
+    def hosted(self, node):
+        return node in self.nodes
+
+    def socket_path(self, node):
+        return os.path.join(self.socket_dir, "%d.%d.sock" % (node, self.generations[node]))
+
+    def add_node(self, node):
+        if node not in self.live:
+            self.live.add(node)
+            self.generations[node] = self.generations.get(node, 0) + 1
+        super().add_node(node)
+        if node not in self.hosts and self.hosted(node):
+            self.hosts[node] = Node_Host(self, self.nodes[node], self.socket_path(node))
+
+    def delete_node(self, node):
+        super().delete_node(node)
+        self.live.discard(node)
+        host = self.hosts.pop(node, None)
+        if host is not None:
+            host.close()
+
+    def post_send_link(self, node, neighbor, latency):
+        self.link_updates.append((node, neighbor, latency))
+
+    def flush_link_updates(self):
+        # Once the last command of a time stamp ran: to the nodes still there, in order with their messages
+        for node, neighbor, latency in self.link_updates:
+            host = self.hosts.get(node)
+            if host is not None:
+                host.inbox.put_nowait(('link', neighbor, latency))
+        self.link_updates = []
+
+    def dispatch_commands(self, events):
+        # A batch of event file commands, whole time stamps only
+        for i, e in enumerate(events):
+            e.dispatch(self)
+            if i + 1 == len(events) or events[i + 1].time_stamp != e.time_stamp:
+                self.flush_link_updates()
+
+    def send_to_neighbor(self, node, neighbor, m):
+        latency = self.latency(node, neighbor)
+        if latency is None:
+            return
+        self.sent_count[node] = self.sent_count.get(node, 0) + 1
+        self.scheduled += 1
+        delay = self.link_delay(node, neighbor, latency, m) * self.scale
+        asyncio.get_running_loop().call_later(delay, self.transmit, node, neighbor, frame(node, m, time.monotonic() + delay))
+
+    def transmit(self, node, neighbor, data):
+        self.scheduled -= 1
+        if neighbor not in self.live:
+            self.dropped += 1
+            return
+        path = self.socket_path(neighbor)
+        channel = self.channels.get((node, neighbor))
+        if channel is None or channel.path != path:
+            if channel is not None:
+                channel.close()
+            channel = self.channels[node, neighbor] = Channel(self, path)
+        channel.send(data)
+
+    def run_callback(self, host, item):
+        started = time.monotonic()
+        try:
+            if item[0] == 'link':
+                host.node.link_has_been_updated(item[1], item[2])
+            else:
+                _, sender, m, due = item
+                self.message_count += 1
+                host.node.process_incoming_routing_message(m)
+                self.lags.append(started - due)
+                self.message_times.append(started)
+                if self.recorder is not None:
+                    self.recorder.record(Event(self.get_time(), EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL, host.node.id, m,
+                                               sender=sender))
+                if self.metrics is not None:
+                    self.metrics.add(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL, 1)
+        except Exception as e:
+            if self.failure is None:
+                self.failure = e
+        if self.traffic is not None:
+            self.traffic.invalidate(host.node.id)
+        self.last_callback = time.monotonic()
+        if item[0] == 'message':
+            self.callback_times.append(self.last_callback - started)
+        self.forget_routes()
+
+    def waiting(self):
+        return self.scheduled + sum(host.inbox.qsize() for host in self.hosts.values())
+
+    def busy(self):
+        return self.waiting() > 0 or any(channel.busy() for channel in self.channels.values())
+
+    def hosting_status(self):
+        return self.busy(), self.sent, self.received, self.last_callback, self.message_count, self.waiting()
+
+    def close_channels(self):
+        # Before the hosts, so every receiving end sees the end of its stream
+        for channel in self.channels.values():
+            channel.close()
+
+    async def close_hosts(self):
+        deadline = time.monotonic() + EMULATION_QUIET
+        while self.connections > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        for host in self.hosts.values():
+            host.close()
+        await asyncio.sleep(0)
+
+    def hosting_stats(self):
+        return self.callback_times, self.lags, self.message_times, self.message_count, self.dropped
+
+
+class Emulation_Topology(Node_Hosting, Topology):
+    """The nodes of one emulation worker. Like a Partition_Topology it sees every topology command."""
+
+    def __init__(self, algorithm, owner, rank, scale, socket_dir, trace=None):
+        super().__init__(algorithm, 'NO_STOP', trace)
+        self.init_hosting(scale)
+        # The coordinator replays the same topology commands and logs (and traces) them once
+        self.logging = logging.getLogger('Sim.worker')
+        self.logging.setLevel(logging.ERROR)
+        self.trace.topology = None
+        self.socket_dir = socket_dir
+        self.owner = owner
+        self.rank = rank
+        self.recorder = None
+        self.metrics = None
+
+    def owns(self, node):
+        return self.owner.get(node, 0) == self.rank
+
+
+async def serve_commands(conn, topology):
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    async def stop():
+        await topology.close_hosts()
+        conn.send(('ok', topology.hosting_stats()))
+
+    def command():
+        try:
+            command = conn.recv()
+        except EOFError:
+            done.set_result(None)
+            return
+        try:
+            if command[0] == 'events':
+                # One way, a failure shows in the next status
+                topology.dispatch_commands(command[1])
+            elif command[0] == 'start':
+                topology.start = command[1]
+                conn.send(('ok',))
+            elif command[0] == 'status':
+                failure = None if topology.failure is None else repr(topology.failure)
+                conn.send(('ok', topology.hosting_status(), failure))
+            elif command[0] == 'call':
+                _, node, method, args = command
+                conn.send(('ok', getattr(topology.nodes[node], method)(*args)))
+            elif command[0] == 'drain':
+                topology.close_channels()
+                conn.send(('ok',))
+            elif command[0] == 'stop':
+                loop.create_task(stop())
+            elif command[0] == 'exit':
+                conn.send(('ok',))
+                done.set_result(None)
+        except Exception:
+            if command[0] == 'events':
+                topology.failure = topology.failure or RuntimeError(traceback.format_exc())
+            else:
+                conn.send(('error', traceback.format_exc()))
+
+    loop.add_reader(conn.fileno(), command)
+    await done
+    loop.remove_reader(conn.fileno())
+
+
+def emulation_worker(conn, algorithm, scenario, owner, rank, scale, socket_dir, log_level, record, trace):
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=log_level, format=LOGGING_FORMAT, datefmt=LOGGING_DATAFMT)
+
+    topology = Emulation_Topology(algorithm, owner, rank, scale, socket_dir, Trace_Flags(*trace))
+    if record is not None:
+        topology.recorder = Event_Recorder(record, scenario, algorithm)
+    conn.send(('ok',))
+    asyncio.run(serve_commands(conn, topology))
+    if topology.recorder is not None:
+        topology.recorder.close()
+    conn.close()
+
+
+class Emulation_Pool:
+    """The coordinator's handle on the emulation workers, see the comment at the top."""
+
+    def __init__(self, algorithm, scenario, owner, parts, scale, socket_dir, record=None, trace=((), 1)):
+        self.owner = owner
+        self.record = record
+        self.pending = []
+        self.conns = []
+        self.procs = []
+        ctx = multiprocessing.get_context()
+        for rank in range(parts):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=emulation_worker,
+                            args=(child, algorithm, scenario, owner, rank, scale, socket_dir,
+                                  logging.getLogger().level, self.recording(rank), trace),
+                            daemon=True)
+            p.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(p)
+        for conn in self.conns:
+            self.reply(conn)
+
+    def reply(self, conn):
+        reply = conn.recv()
+        if reply[0] == 'error':
+            raise RuntimeError("Emulation worker failed:\n" + reply[1])
+        return reply[1:]
+
+    def broadcast(self, *command):
+        for conn in self.conns:
+            conn.send(command)
+        return [self.reply(conn) for conn in self.conns]
+
+    def start(self, start):
+        self.broadcast('start', start)
+
+    def post(self, e):
+        self.pending.append(e)
+
+    def flush(self):
+        if self.pending:
+            for conn in self.conns:
+                conn.send(('events', self.pending))
+            self.pending = []
+
+    def status(self):
+        """(busy, frames sent, frames received, last callback, messages, messages waiting) over all workers."""
+        self.flush()
+        replies = self.broadcast('status')
+        for _, failure in replies:
+            if failure is not None:
+                raise RuntimeError("Emulation worker failed: " + failure)
+        statuses = [status for status, _ in replies]
+        return (any(s[0] for s in statuses), sum(s[1] for s in statuses), sum(s[2] for s in statuses),
+                max(s[3] for s in statuses), sum(s[4] for s in statuses), sum(s[5] for s in statuses))
+
+    def call(self, time_stamp, node, method, *args):
+        # The clock is shared, time_stamp is only there to match Partition_Pool.call
+        self.flush()
+        conn = self.conns[self.owner.get(node, 0)]
+        conn.send(('call', node, method, args))
+        return self.reply(conn)[0]
+
+    def finish(self):
+        """Close every connection, then every host; the merged hosting_stats() of the workers."""
+        self.flush()
+        self.broadcast('drain')
+        stats = [reply[0] for reply in self.broadcast('stop')]
+        return ([t for s in stats for t in s[0]], [t for s in stats for t in s[1]],
+                sorted(t for s in stats for t in s[2]), sum(s[3] for s in stats), sum(s[4] for s in stats))
+
+    def recording(self, rank):
+        return None if self.record is None else "%s.part%d" % (self.record, rank)
+
+    def recordings(self):
+        # Recordings the workers have written, call after close
+        return [self.recording(rank) for rank in range(len(self.conns))
+                if self.record is not None and os.path.exists(self.recording(rank))]
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(('exit',))
+                self.reply(conn)
+            except (OSError, EOFError, RuntimeError):
+                pass
+        for p in self.procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+
+
+def percentiles(values):
+    """mean, p50, p99 and max of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0, 0, 0, 0
+    values = sorted(values)
+    return (sum(values) / len(values), values[len(values) // 2],
+            values[min(len(values) - 1, int(len(values) * 0.99))], values[-1])
+
+
+def convergence(changes, message_times):
+    """
+    changes: ascending times of topology changes; message_times: ascending times messages were handled.
+    Returns [(change time, messages until the next change, time from the change to the last of them)].
+    """
+    timeline = []
+    j = 0
+    for i, t in enumerate(changes):
+        end = changes[i + 1] if i + 1 < len(changes) else float('inf')
+        while j < len(message_times) and message_times[j] < t:
+            j += 1
+        first = j
+        while j < len(message_times) and message_times[j] < end:
+            j += 1
+        timeline.append((t, j - first, message_times[j - 1] - t if j > first else None))
+    return timeline
+
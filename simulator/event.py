@@ -4,21 +4,41 @@ from simulator.config import *
 
 
 class Event:
+    # Queues can hold millions of routing messages: no per-event __dict__, and the simulation
+    # to act on is passed to dispatch() instead of being stored in every event.
+    __slots__ = ('time_stamp', 'event_type', 'arg1', 'arg2', 'arg3', 'seq', 'sender')
+    # Only ADD_LINK / CHANGE_LINK with a bandwidth have a fourth argument, see Bandwidth_Event
+    arg4 = -1
 
-    def __init__(self, time_stamp, event_type, sim, arg1 = -1, arg2 = -1, arg3 = -1):
+    def __init__(self, time_stamp, event_type, arg1 = -1, arg2 = -1, arg3 = -1, seq = 0, sender = 0):
         self.time_stamp = time_stamp
         self.event_type = event_type
-        self.sim = sim
 
         self.arg1 = arg1
         self.arg2 = arg2
         self.arg3 = arg3
 
+        # A fixed order for events within the same second: commands from the event file (seq is the
+        # line), then routing messages (by sender and the sender's message count), then SEND_LINK (by
+        # posting order). It only depends on what happened before, so a partitioned run sees the same order.
+        self.seq = seq
+        self.sender = sender
+
+    @property
+    def key(self):
+        # Built when asked for, the order as one tuple: (time, rank, sender, seq)
+        return (self.time_stamp, EVENT_RANK.get(self.event_type, 0), self.sender, self.seq)
+
     def __lt__(self, other):
-        if self.time_stamp == other.time_stamp:
-            if self.event_type != EVENT_TYPE.SEND_LINK and other.event_type == EVENT_TYPE.SEND_LINK:
-                return True
-        return self.time_stamp < other.time_stamp
+        # Same as self.key < other.key, without building the tuples
+        if self.time_stamp != other.time_stamp:
+            return self.time_stamp < other.time_stamp
+        rank, other_rank = EVENT_RANK.get(self.event_type, 0), EVENT_RANK.get(other.event_type, 0)
+        if rank != other_rank:
+            return rank < other_rank
+        if self.sender != other.sender:
+            return self.sender < other.sender
+        return self.seq < other.seq
 
     def __str__(self):
         args = ""
@@ -28,37 +48,65 @@ class Event:
             args += " " + str(self.arg2)
         if self.arg3 != -1:
             args += " " + str(self.arg3)
+        if self.arg4 != -1:
+            args += " " + str(self.arg4)
 
         return "Time_Stamp: " + str(self.time_stamp) + " Event_Type: " + self.event_type + args
 
-    def dispatch(self):
+    def dispatch(self, sim):
         if self.event_type == EVENT_TYPE.ADD_NODE:
-            self.sim.add_node(self.arg1)
+            sim.add_node(self.arg1)
         elif self.event_type == EVENT_TYPE.ADD_LINK:
-            self.sim.add_link(self.arg1, self.arg2, self.arg3)
+            sim.add_link(self.arg1, self.arg2, self.arg3, self.arg4)
         elif self.event_type == EVENT_TYPE.CHANGE_LINK:
-            self.sim.change_link(self.arg1, self.arg2, self. arg3)
+            sim.change_link(self.arg1, self.arg2, self.arg3, self.arg4)
         elif self.event_type == EVENT_TYPE.DELETE_LINK:
-            self.sim.delete_link(self.arg1, self.arg2)
+            sim.delete_link(self.arg1, self.arg2)
         elif self.event_type == EVENT_TYPE.DELETE_NODE:
-            self.sim.delete_node(self.arg1)
+            sim.delete_node(self.arg1)
         elif self.event_type == EVENT_TYPE.PRINT:
-            self.sim.print_comment(self.arg1)
+            sim.print_comment(self.arg1)
         elif self.event_type == EVENT_TYPE.DUMP_NODE:
-            self.sim.dump_node(self.arg1)
+            sim.dump_node(self.arg1)
         elif self.event_type == EVENT_TYPE.DRAW_TOPOLOGY:
-            self.sim.draw_topology()
+            sim.draw_topology()
         elif self.event_type == EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL:
-            self.sim.routing_message_arrival(self.arg1, self.arg2)
+            sim.routing_message_arrival(self.arg1, self.arg2)
         elif self.event_type == EVENT_TYPE.DUMP_SIM:
-            self.sim.dump_sim()
+            sim.dump_sim()
         elif self.event_type == EVENT_TYPE.DRAW_PATH:
-            self.sim.draw_path(self.arg1, self.arg2)
+            sim.draw_path(self.arg1, self.arg2)
         elif self.event_type == EVENT_TYPE.DRAW_TREE:
-            self.sim.draw_tree(self.arg1)
+            sim.draw_tree(self.arg1)
+        elif self.event_type == EVENT_TYPE.EXPORT_ROUTES:
+            sim.export_routes()
         elif self.event_type == EVENT_TYPE.SEND_LINK:
-            self.sim.send_link(self.arg1, self.arg2, self.arg3)
+            sim.send_link(self.arg1, self.arg2, self.arg3)
+        elif self.event_type == EVENT_TYPE.DATA_PACKET_ARRIVAL:
+            sim.data_packet_arrival(self.arg1, self.arg2, self.arg3)
+        elif self.event_type == EVENT_TYPE.INJECT_TRAFFIC:
+            sim.inject_traffic(self.arg1, self.arg2, self.arg3)
+        elif self.event_type == EVENT_TYPE.SEND_TRAFFIC:
+            sim.send_traffic(self.arg1, self.arg2, self.arg3)
         else:
             pass
             # sys.stderr.write("Unknown event type %s" % self.event_type)
             # sys.exit(-1)
+
+
+class Bandwidth_Event(Event):
+    # A link command with a bandwidth, the slot is only paid for by these
+    __slots__ = ('arg4',)
+
+    def __init__(self, time_stamp, event_type, arg1, arg2, arg3, arg4, seq=0):
+        super().__init__(time_stamp, event_type, arg1, arg2, arg3, seq)
+        self.arg4 = arg4
+
+
+def make_event(time_stamp, event_type, *args, seq=0):
+    """An Event, or a Bandwidth_Event when there are four arguments (-1 for no bandwidth gives a plain Event)."""
+    if len(args) == 4:
+        if args[3] != -1:
+            return Bandwidth_Event(time_stamp, event_type, *args, seq=seq)
+        args = args[:3]
+    return Event(time_stamp, event_type, *args, seq=seq)
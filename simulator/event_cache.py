@@ -0,0 +1,94 @@
+import os
+import json
+import struct
+import logging
+
+from simulator.config import *
+from simulator.event import make_event
+
+
+# Compiled event files.
+#
+# Parsing a large .event file dominates short runs, so the parsed commands are kept next to it in
+# `<file>` + COMPILED_EVENT_SUFFIX and reused while the source still has the size and modification
+# time (in ns) it had when it was compiled. A copy that does not decode is ignored as well.
+#
+# Layout: COMPILED_EVENT_MAGIC, a little endian uint32 header length, a JSON header
+# ({"source": [size, mtime_ns], "count": records, "types": [...], "strings": [...]}), then one
+# record per command in file order:
+#
+#     time (int64), arg1 (int64), arg2 (int64), arg3 (int64), arg4 (int64), type (int32)
+#
+# Types are indices into header["types"]. For PRINT, arg1 is an index into header["strings"].
+# arg4 is the bandwidth of a link command, -1 for none.
+
+COMPILED_EVENT_MAGIC = b'RSIMEVT3'
+
+COMPILED_EVENT = struct.Struct('<qqqqqi')
+
+
+def compiled_file(file):
+    return file + COMPILED_EVENT_SUFFIX
+
+
+def save_compiled(file, events):
+    """Write the events parsed from `file`, in file order. Failing to write only costs the speedup."""
+    filename = compiled_file(file)
+    tmp = "%s.%d.tmp" % (filename, os.getpid())
+    try:
+        source = os.stat(file)
+        types, strings = {}, []
+        records = bytearray()
+        for e in events:
+            arg1 = e.arg1
+            if e.event_type == EVENT_TYPE.PRINT:
+                strings.append(arg1)
+                arg1 = len(strings) - 1
+            records += COMPILED_EVENT.pack(e.time_stamp, arg1, e.arg2, e.arg3, e.arg4,
+                                           types.setdefault(e.event_type, len(types)))
+        header = json.dumps({"source": [source.st_size, source.st_mtime_ns], "count": len(records) // COMPILED_EVENT.size,
+                             "types": list(types), "strings": strings}).encode()
+
+        with open(tmp, 'wb') as f:
+            f.write(COMPILED_EVENT_MAGIC + struct.pack('<I', len(header)) + header)
+            f.write(records)
+        os.replace(tmp, filename)
+    except (OSError, struct.error) as e:
+        # Such as a read only folder or numbers too large for the record
+        logging.getLogger('Sim').debug("Cannot compile %s: %s" % (file, e))
+
+
+def load_compiled(file):
+    """The events of `file` from its compiled copy, or None when there is no up to date, intact copy."""
+    filename = compiled_file(file)
+    try:
+        source = os.stat(file)
+        with open(filename, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    start = len(COMPILED_EVENT_MAGIC) + 4
+    if data[:len(COMPILED_EVENT_MAGIC)] != COMPILED_EVENT_MAGIC:
+        return None
+    try:
+        length, = struct.unpack_from('<I', data, len(COMPILED_EVENT_MAGIC))
+        header = json.loads(data[start:start + length])
+        if header["source"] != [source.st_size, source.st_mtime_ns]:
+            return None
+        types, strings = header["types"], header["strings"]
+        records = memoryview(data)[start + length:]
+        if len(records) != header["count"] * COMPILED_EVENT.size:
+            return None
+
+        events = []
+        for order, (time_stamp, arg1, arg2, arg3, arg4, event_type) in enumerate(COMPILED_EVENT.iter_unpack(records)):
+            event_type = types[event_type]
+            if event_type == EVENT_TYPE.PRINT:
+                arg1 = strings[arg1]
+            events.append(make_event(time_stamp, event_type, arg1, arg2, arg3, arg4, seq=order))
+    except (ValueError, TypeError, KeyError, IndexError, struct.error) as e:
+        # Truncated or corrupt, parse the source again (JSONDecodeError is a ValueError)
+        logging.getLogger('Sim').debug("Ignoring %s: %s" % (filename, e))
+        return None
+    return events
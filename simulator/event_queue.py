@@ -1,30 +1,87 @@
 import heapq
+import itertools
 
 
 class Event_Queue:
-    q = []
-    Current_Time = 0
+    # Events sharing a time stamp come out in the order of Event.key, whatever the heap looks like
 
-    @staticmethod
-    def Post(e):
-        heapq.heappush(Event_Queue.q, e)
+    def __init__(self):
+        self.q = []
+        self.Current_Time = 0
 
-    @staticmethod
-    def Get_Earliest():
-        if Event_Queue.q == []:
+    def __len__(self):
+        return len(self.q)
+
+    def __iter__(self):
+        # All waiting events, in no particular order
+        return iter(self.q)
+
+    def Post(self, e):
+        heapq.heappush(self.q, e)
+
+    def Extend(self, events):
+        self.q.extend(events)
+        heapq.heapify(self.q)
+
+    def Load(self, events):
+        self.q = []
+        self.Extend(events)
+
+    def Peek(self):
+        if self.q == []:
             return None
-        e = heapq.heappop(Event_Queue.q)
-        Event_Queue.Current_Time = e.time_stamp
+        return self.q[0]
+
+    def Get_Earliest(self):
+        if self.q == []:
+            return None
+        e = heapq.heappop(self.q)
+        self.Current_Time = e.time_stamp
         return e
 
-    @staticmethod
-    def Str():
+    def Str(self, limit=None):
+        # At most `limit` events (in queue order), then how many were left out
         ans = ""
-        for i in Event_Queue.q:
+        for i in itertools.islice(self, limit):
             ans += str(i)
             ans += "\n"
+        if limit is not None and len(self) > limit:
+            ans += "... %d more events\n" % (len(self) - limit)
         return ans
 
-    @staticmethod
-    def Get_Current_Time():
-        return Event_Queue.Current_Time
+    def Get_Current_Time(self):
+        return self.Current_Time
+
+
+class Ranked_Event_Queue(Event_Queue):
+    """
+    The order of Event_Queue, with every event stored next to its key so the heap compares tuples
+    instead of calling Event.__lt__. The key is only built here, events do not keep one. The partition
+    workers (sim.py --workers) use it.
+    """
+
+    def __init__(self, events=()):
+        super().__init__()
+        self.Load(events)
+
+    def __iter__(self):
+        return (e for _, e in self.q)
+
+    def Post(self, e):
+        heapq.heappush(self.q, (e.key, e))
+
+    def Extend(self, events):
+        self.q.extend((e.key, e) for e in events)
+        heapq.heapify(self.q)
+
+    def Peek(self):
+        if self.q == []:
+            return None
+        return self.q[0][1]
+
+    def Get_Earliest(self):
+        if self.q == []:
+            return None
+        _, e = heapq.heappop(self.q)
+        self.Current_Time = e.time_stamp
+        return e
@@ -0,0 +1,108 @@
+import os
+import csv
+import shutil
+import tempfile
+import zipfile
+import numpy as np
+
+
+# Routing state export (EXPORT_ROUTES events, sim.py --export).
+#
+# Nodes get dense ids 0..n-1 in ascending node order; `nodes[i]` is the node id of dense id i.
+# For every source row and destination column:
+#     next_hop   dense id of the next hop the source node reports, -1 when it has none
+#     cost       cost the source node reports, inf when it has none
+#     distance   reference shortest path length on the real topology, inf when unreachable
+#
+# A .csv file name writes one row per (source, destination) pair with a next hop or a finite
+# distance, using node ids. Anything else writes a NumPy .npz archive of the arrays above plus `time`.
+#
+# Both are written one source at a time: the n x n arrays are never held in memory, the .npz
+# members are streamed into the archive row by row (the cost rows wait in a temporary file
+# while next_hop is written).
+
+
+def route_row(index, table):
+    """next_hop and cost rows of one source. table: {destination: (next hop, cost)}."""
+    n = len(index)
+    next_hop = np.full(n, -1, dtype=np.int64)
+    cost = np.full(n, np.inf)
+    for destination, (hop, c) in table.items():
+        j = index.get(destination)
+        if j is not None:
+            next_hop[j] = index.get(hop, -1)
+            cost[j] = c
+    return next_hop, cost
+
+
+def distance_row(index, lengths):
+    """distance row of one source. lengths: {destination: length}."""
+    distance = np.full(len(index), np.inf)
+    for destination, length in lengths.items():
+        distance[index[destination]] = length
+    return distance
+
+
+def write_routes(filename, time_stamp, nodes, table, lengths):
+    """
+    nodes: ascending node ids; table(source) -> {destination: (next hop, cost)};
+    lengths(source) -> {destination: reference length}. Each is called once per source.
+    """
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    index = {node: i for i, node in enumerate(nodes)}
+
+    if filename.endswith('.csv'):
+        write_csv(filename, time_stamp, nodes, index, table, lengths)
+    else:
+        write_npz(filename, time_stamp, nodes, index, table, lengths)
+
+
+def write_csv(filename, time_stamp, nodes, index, table, lengths):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time', 'source', 'destination', 'next_hop', 'cost', 'distance'])
+        for source in nodes:
+            next_hop, cost = route_row(index, table(source))
+            distance = distance_row(index, lengths(source))
+            for j in np.nonzero((next_hop != -1) | np.isfinite(distance))[0]:
+                hop = nodes[next_hop[j]] if next_hop[j] != -1 else -1
+                writer.writerow([time_stamp, source, nodes[j], hop, cost[j], distance[j]])
+
+
+def write_npz(filename, time_stamp, nodes, index, table, lengths):
+    # Same layout as np.savez, which also adds the extension
+    if not filename.endswith('.npz'):
+        filename += '.npz'
+    n = len(nodes)
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        write_member(archive, 'time', np.int64(time_stamp))
+        write_member(archive, 'nodes', np.asarray(nodes, dtype=np.int64))
+
+        with tempfile.TemporaryFile() as costs:
+            with open_member(archive, 'next_hop', np.int64, (n, n)) as f:
+                for source in nodes:
+                    next_hop, cost = route_row(index, table(source))
+                    f.write(next_hop.tobytes())
+                    costs.write(cost.tobytes())
+            costs.seek(0)
+            with open_member(archive, 'cost', np.float64, (n, n)) as f:
+                shutil.copyfileobj(costs, f)
+
+        with open_member(archive, 'distance', np.float64, (n, n)) as f:
+            for source in nodes:
+                f.write(distance_row(index, lengths(source)).tobytes())
+
+
+def write_member(archive, name, array):
+    with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+
+def open_member(archive, name, dtype, shape):
+    # An .npy member whose rows the caller writes in C order
+    f = archive.open(name + '.npy', 'w', force_zip64=True)
+    np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                             'fortran_order': False, 'shape': shape})
+    return f
@@ -0,0 +1,181 @@
+import weakref
+from collections.abc import MutableMapping
+
+
+# Copy-on-write link state databases.
+#
+# Once link state routing converges every node holds the same database, so a simulation keeps
+# one shared base dict per database (Shared_Store) and each node sees it through a
+# Shared_Dict_View: a dict-like object made of the shared base plus a small overlay with the
+# entries where the node differs (newer or older records, or a tombstone for a missing entry).
+#
+# Equal records are interned, so views and the base point at the same objects. Records are
+# never changed in place, they are replaced. When the overlays grow large the store folds:
+# the new base gets, for every key, the value most views agree on (leaving the key out when
+# most views do not have it), and every overlay is rebuilt against it.
+#
+# Key order is kept once, by the base (insertion ordered, rebuilt on fold): a view iterates the
+# base keys it has not deleted, then the keys only its overlay has, in the order it added them.
+# That is the node's own dict order as long as the node does not delete a base key and add it
+# again, which keeps its base position instead of moving to the end. A view only holds its
+# overlay and its size, nothing per key of the base.
+
+FOLD_MIN = 1024
+
+_MISSING = object()
+
+
+def _token(value):
+    # Equal records get equal tokens, records are flat dicts of ints
+    return tuple(value.items()) if type(value) is dict else value
+
+
+class Shared_Store:
+
+    def __init__(self):
+        self.base = {}
+        self.views = []
+        self.keys = {}
+        self.records = {}
+        self.overlay = 0
+        self.next_fold = FOLD_MIN
+        self.folds = 0
+
+    def view(self):
+        # A new view is empty: it gets an empty base of its own until the next fold rebases it
+        v = Shared_Dict_View(self)
+        self.views.append(weakref.ref(v))
+        return v
+
+    def live_views(self):
+        views = [ref() for ref in self.views]
+        views = [v for v in views if v is not None]
+        self.views = [weakref.ref(v) for v in views]
+        return views
+
+    def intern(self, key, value):
+        key = self.keys.setdefault(key, key)
+        return key, self.records.setdefault(_token(value), value)
+
+    def grew(self, count):
+        self.overlay += count
+        if self.overlay >= self.next_fold:
+            self.fold()
+
+    def fold(self):
+        views = self.live_views()
+
+        # Votes for every value of every key
+        votes = {}
+        for v in views:
+            for key, value in v.items():
+                ballot = votes.setdefault(key, {})
+                token = _token(value)
+                if token in ballot:
+                    ballot[token][1] += 1
+                else:
+                    ballot[token] = [value, 1]
+
+        # Keep the old base order, then keys in the order they were first seen
+        base = {}
+        for key in list(self.base) + [key for key in votes if key not in self.base]:
+            if key not in votes:
+                continue
+            value, count = max(votes[key].values(), key=lambda ballot: ballot[1])
+            if 2 * count > len(views):
+                base[key] = value
+
+        # Rebuild overlays against the new base
+        self.base = base
+        self.overlay = 0
+        for v in views:
+            self.overlay += v.rebase(base)
+        self.keys = {key: key for key in base}
+        self.records = {_token(value): value for value in base.values()}
+        for v in views:
+            for key, value in v.own.items():
+                if value is not _MISSING:
+                    self.keys.setdefault(key, key)
+                    self.records.setdefault(_token(value), value)
+
+        # Overlays that still disagree do not count towards the next fold
+        self.next_fold = max(FOLD_MIN, len(base) * len(views) // 4, 2 * self.overlay)
+        self.folds += 1
+
+
+class Shared_Dict_View(MutableMapping):
+    """One node's dict on top of a Shared_Store, see the comment at the top."""
+
+    __slots__ = ('store', 'base', 'own', 'size', '__weakref__')
+
+    def __init__(self, store):
+        self.store = store
+        self.base = {}
+        self.own = {}
+        self.size = 0
+
+    def __getitem__(self, key):
+        value = self.own.get(key, self)
+        if value is self:
+            return self.base[key]
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        value = self.own.get(key, self)
+        if value is self:
+            return key in self.base
+        return value is not _MISSING
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.size += 1
+        key, value = self.store.intern(key, value)
+        if self.base.get(key, _MISSING) is value:
+            if self.own.pop(key, None) is not None:
+                self.store.grew(-1)
+        else:
+            new = key not in self.own
+            self.own[key] = value
+            if new:
+                self.store.grew(1)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.size -= 1
+        if key in self.base:
+            new = key not in self.own
+            self.own[key] = _MISSING
+            if new:
+                self.store.grew(1)
+        else:
+            del self.own[key]
+            self.store.grew(-1)
+
+    def __iter__(self):
+        own, base = self.own, self.base
+        for key in base:
+            if own.get(key) is not _MISSING:
+                yield key
+        for key in own:
+            if key not in base:
+                yield key
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def rebase(self, base):
+        """Keep the same contents on top of a new base, returns the overlay size."""
+        content = dict(self.items())
+        own = {key: value for key, value in content.items() if base.get(key, _MISSING) is not value}
+        for key in base:
+            if key not in content:
+                own[key] = _MISSING
+        self.base = base
+        self.own = own
+        return len(own)
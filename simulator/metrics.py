@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import logging
+import resource
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from simulator.config import *
+
+
+# Live metrics (sim.py --metrics-port / --metrics-file).
+#
+# The dispatch loop only counts events by type. A background thread takes a sample every
+# METRICS_INTERVAL seconds of wall time: event rates since the previous sample, and the stats
+# file, rewritten in one step. The HTTP endpoint answers from the counters and the latest rates,
+# so both keep reporting while a single event takes long, which is how a stall shows.
+#
+# Both use the Prometheus text format, so the file also works with node_exporter's textfile collector:
+#
+#     routesim_sim_time                      current simulated time
+#     routesim_wall_seconds                  seconds since the run started
+#     routesim_events_total                  events dispatched
+#     routesim_events_per_second             events per wall second over the last interval
+#     routesim_messages_total                routing messages delivered
+#     routesim_queue_depth                   events waiting
+#     routesim_resident_memory_bytes         resident memory of the simulator process
+#     routesim_events_by_type_total{type}    events dispatched per type
+#     routesim_event_rate{type}              per type events per wall second over the last interval
+
+
+def peak_memory():
+    """Peak resident set size of this process in bytes (ru_maxrss is in bytes on macOS, KiB elsewhere)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def resident_memory():
+    """Resident set size in bytes, the peak size where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_memory()
+
+
+class Metrics:
+
+    def __init__(self, port=None, filename=None, interval=METRICS_INTERVAL):
+        self.port = port
+        self.filename = filename
+        self.interval = interval
+        self.sim = None
+        self.counts = {}
+        self.start = time.time()
+        # Wall time and counts of the previous sample, rates since then
+        self.last = (self.start, {})
+        self.rates = {}
+        self.server = None
+        self.stopping = threading.Event()
+        self.sampler = None
+
+    def start_run(self, sim):
+        self.sim = sim
+        self.start = time.time()
+        self.last = (self.start, {})
+        if self.port is not None:
+            self.server = ThreadingHTTPServer((METRICS_HOST, self.port), metrics_handler(self))
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            sim.logging.info("Metrics at http://%s:%d/metrics" % self.server.server_address[:2])
+        self.sampler = threading.Thread(target=self.run_sampler, daemon=True)
+        self.sampler.start()
+
+    def tick(self, e):
+        self.counts[e.event_type] = self.counts.get(e.event_type, 0) + 1
+
+    def add(self, event_type, count):
+        # Events dispatched elsewhere, such as the routing messages of partition workers
+        self.counts[event_type] = self.counts.get(event_type, 0) + count
+
+    def run_sampler(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        now, counts = time.time(), dict(self.counts)
+        last_time, last_counts = self.last
+        elapsed = max(now - last_time, 1e-9)
+        self.rates = {t: (c - last_counts.get(t, 0)) / elapsed for t, c in counts.items()}
+        self.last = (now, counts)
+        if self.filename is not None:
+            self.write(self.filename)
+
+    def text(self):
+        counts, rates, sim = dict(self.counts), dict(self.rates), self.sim
+        lines = [
+            "# TYPE routesim_sim_time gauge",
+            "routesim_sim_time %d" % sim.get_time(),
+            "# TYPE routesim_wall_seconds gauge",
+            "routesim_wall_seconds %.3f" % (time.time() - self.start),
+            "# TYPE routesim_events_total counter",
+            "routesim_events_total %d" % sum(counts.values()),
+            "# TYPE routesim_events_per_second gauge",
+            "routesim_events_per_second %.3f" % sum(rates.values()),
+            "# TYPE routesim_messages_total counter",
+            "routesim_messages_total %d" % counts.get(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL, 0),
+            "# TYPE routesim_queue_depth gauge",
+            "routesim_queue_depth %d" % sim.queue_depth(),
+            "# TYPE routesim_resident_memory_bytes gauge",
+            "routesim_resident_memory_bytes %d" % resident_memory(),
+            "# TYPE routesim_events_by_type_total counter",
+        ]
+        lines += ['routesim_events_by_type_total{type="%s"} %d' % (t, c) for t, c in sorted(counts.items())]
+        lines.append("# TYPE routesim_event_rate gauge")
+        lines += ['routesim_event_rate{type="%s"} %.3f' % (t, r) for t, r in sorted(rates.items())]
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        tmp = "%s.%d.tmp" % (filename, os.getpid())
+        try:
+            with open(tmp, 'w') as f:
+                f.write(self.text())
+            os.replace(tmp, filename)
+        except OSError as e:
+            logging.getLogger('Sim').warning("Cannot write metrics to %s: %s" % (filename, e))
+
+    def close(self):
+        # A last sample, so the file shows the end of the run
+        self.stopping.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sample()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def metrics_handler(metrics):
+
+    class Metrics_Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics.text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Metrics_Handler
@@ -1,10 +1,27 @@
 import logging
 
 class Node:
+    # sim and index (the dense index of id, see index_of) are bound by Topology.create_node before __init__ runs.
+    # Subclasses without __slots__ of their own still get a __dict__ for their state.
+    __slots__ = ('sim', 'id', 'index', 'neighbors', '_logger')
+
     def __init__(self, id):
         self.id = id
         self.neighbors = []
-        self.logging = logging.getLogger('Node %d' % self.id)
+
+    @property
+    def logging(self):
+        # Looked up the first time a node logs, so nodes that never do get no logger (see also simulator/tracing.py)
+        try:
+            return self._logger
+        except AttributeError:
+            self._logger = logging.getLogger('Node %d' % self.id)
+            return self._logger
+
+    @logging.setter
+    def logging(self, logger):
+        # Nodes may still pick their own logger, as they could before
+        self._logger = logger
 
     def __str__(self):
         pass
@@ -20,23 +37,35 @@ class Node:
         pass
 
     def get_routing_table(self):
+        # Optional: {destination: (next hop, cost)} for every reachable destination.
+        # Return None to have the simulator ask get_next_hop() one destination at a time.
         pass
 
     def send_to_neighbors(self, message: str):
-        from simulator.topology import Send_To_Neighbors
-        Send_To_Neighbors(self, message)
+        self.sim.send_to_neighbors(self.id, message)
 
     def send_to_neighbor(self, neighbor, message: str):
-        from simulator.topology import Send_To_Neighbor
         # neighbor is an integer
-        Send_To_Neighbor(self, neighbor, message)
+        self.sim.send_to_neighbor(self.id, neighbor, message)
 
     def get_time(self):
-        from simulator.topology import Get_Time
-        return Get_Time()
+        return self.sim.get_time()
+
+    def index_of(self, node):
+        # Dense index 0..node_count()-1 of a node id, fixed for the whole simulation
+        return self.sim.index_of(node)
+
+    def id_of(self, index):
+        return self.sim.id_of(index)
+
+    def node_count(self):
+        # Number of node ids seen so far, every index is below it
+        return len(self.sim.node_ids)
 
 
 class Link:
+    __slots__ = ('node1', 'node2', 'latency')
+
     def __init__(self, node1, node2, latency):
         self.node1 = node1
         self.node2 = node2
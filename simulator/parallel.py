@@ -0,0 +1,267 @@
+import os
+import logging
+import math
+import traceback
+import multiprocessing
+from collections import deque
+
+from simulator.config import *
+from simulator.event import Event
+from simulator.event_queue import Ranked_Event_Queue
+from simulator.topology import Topology
+from simulator.recorder import Event_Recorder
+from simulator.tracing import Trace_Flags
+
+
+# Conservative parallel simulation.
+#
+# Nodes are split into partitions, one per worker process. Every worker replays all topology
+# events (so each one keeps a full copy of the graph), but only hosts the node objects of its
+# own partition. A routing message is never delivered sooner than the smallest link latency L
+# found in the event file, so once every event before time T is done, all events in [T, T + L)
+# can run in every partition at once: nothing sent inside the window can land inside it.
+# Messages crossing partitions are handed over by the coordinator between windows.
+#
+# Observation events (PRINT, DRAW_*, DUMP_*) run on the coordinator, which stops the window
+# right before them and asks the partitions for the node state it needs.
+
+
+def partition_nodes(events, parts):
+    """
+    Split every node mentioned in the events into `parts` groups of about the same size.
+    Groups are grown breadth first, so neighbors tend to land in the same partition.
+    """
+    adj = {}
+    for e in events:
+        if e.event_type == EVENT_TYPE.ADD_NODE:
+            adj.setdefault(e.arg1, set())
+        elif e.event_type in (EVENT_TYPE.ADD_LINK, EVENT_TYPE.CHANGE_LINK):
+            adj.setdefault(e.arg1, set()).add(e.arg2)
+            adj.setdefault(e.arg2, set()).add(e.arg1)
+
+    # Breadth first order over every component, cut into consecutive chunks
+    order, seen = [], set()
+    for start in sorted(adj):
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for neighbor in sorted(adj[node]):
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+
+    size = max(1, math.ceil(len(order) / parts))
+    owner = {node: i // size for i, node in enumerate(order)}
+    return owner
+
+
+def lookahead(events):
+    """The smallest latency any link ever gets, i.e. the minimum delay of a routing message."""
+    latencies = [e.arg3 for e in events if e.event_type in (EVENT_TYPE.ADD_LINK, EVENT_TYPE.CHANGE_LINK)]
+    return min(latencies, default=float('inf'))
+
+
+class Partition_Topology(Topology):
+
+    def __init__(self, algorithm, owner, rank, trace=None):
+        super().__init__(algorithm, 'NO_STOP', trace)
+        self.event_queue = Ranked_Event_Queue()
+        # The coordinator replays the same topology commands and logs (and traces) them once
+        self.logging = logging.getLogger('Sim.worker')
+        self.logging.setLevel(logging.ERROR)
+        self.trace.topology = None
+        self.owner = owner
+        self.rank = rank
+        self.outbox = []
+        self.recorder = None
+
+    def owns(self, node):
+        return self.owner.get(node, 0) == self.rank
+
+    def drop_observations(self):
+        self.event_queue.Load([e for e in self.event_queue if e.event_type not in OBSERVATION_EVENTS])
+
+    def post_routing_message(self, e):
+        if self.owns(e.arg1):
+            super().post_routing_message(e)
+        else:
+            self.outbox.append((e.time_stamp, e.sender, e.seq, e.arg1, e.arg2))
+
+    def receive(self, messages):
+        for time_stamp, sender, seq, neighbor, m in messages:
+            self.event_queue.Post(Event(time_stamp, EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL, neighbor, m,
+                                        seq=seq, sender=sender))
+
+    def run_until(self, bound):
+        head = self.event_queue.Peek()
+        while head is not None and head.key < bound:
+            e = self.event_queue.Get_Earliest()
+            e.dispatch(self)
+            if self.recorder is not None and e.event_type == EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL:
+                self.recorder.record(e)
+            head = self.event_queue.Peek()
+
+    def next_time(self):
+        head = self.event_queue.Peek()
+        return None if head is None else head.time_stamp
+
+    def take_outbox(self):
+        outbox, self.outbox = self.outbox, []
+        return outbox
+
+
+def partition_worker(conn, algorithm, event_file, owner, rank, log_level, record, trace):
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=log_level, format=LOGGING_FORMAT, datefmt=LOGGING_DATAFMT)
+
+    topology = Partition_Topology(algorithm, owner, rank, Trace_Flags(*trace))
+    topology.load(event_file)
+    if record is not None:
+        topology.recorder = Event_Recorder(record, topology.scenario, algorithm)
+    topology.drop_observations()
+    conn.send(('ok', topology.next_time()))
+
+    while True:
+        command = conn.recv()
+        try:
+            if command[0] == 'run':
+                _, bound, inbox = command
+                topology.receive(inbox)
+                topology.run_until(bound)
+                conn.send(('ok', topology.take_outbox(), topology.next_time(),
+                           topology.message_count, len(topology.event_queue), topology.get_time()))
+            elif command[0] == 'call':
+                _, time_stamp, node, method, args = command
+                topology.event_queue.Current_Time = time_stamp
+                conn.send(('ok', getattr(topology.nodes[node], method)(*args)))
+            elif command[0] == 'queue':
+                # Everything else is replayed by the coordinator as well
+                conn.send(('ok', "".join(str(e) + "\n" for e in topology.event_queue
+                                         if e.event_type == EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL)))
+            elif command[0] == 'stop':
+                if topology.recorder is not None:
+                    topology.recorder.close()
+                conn.send(('ok', topology.message_count))
+                break
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+    conn.close()
+
+
+class Partition_Pool:
+
+    def __init__(self, algorithm, event_file, owner, parts, record=None, trace=((), 1)):
+        self.owner = owner
+        self.record = record
+        self.inbox = [[] for _ in range(parts)]
+        self.next_times = []
+        # Per worker, as of the last window: messages delivered, events waiting and the clock
+        self.message_counts = [0] * parts
+        self.queue_depths = [0] * parts
+        self.times = [0] * parts
+        self.conns = []
+        self.procs = []
+        ctx = multiprocessing.get_context()
+        for rank in range(parts):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(target=partition_worker,
+                            args=(child, algorithm, event_file, owner, rank, logging.getLogger().level,
+                                  self.recording(rank), trace),
+                            daemon=True)
+            p.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(p)
+        for conn in self.conns:
+            self.next_times.append(self.reply(conn)[0])
+
+    def reply(self, conn):
+        reply = conn.recv()
+        if reply[0] == 'error':
+            raise RuntimeError("Partition worker failed:\n" + reply[1])
+        return reply[1:]
+
+    def next_time(self):
+        times = [t for t in self.next_times if t is not None]
+        times += [m[0] for inbox in self.inbox for m in inbox]
+        return min(times, default=None)
+
+    def run(self, bound):
+        for conn, inbox in zip(self.conns, self.inbox):
+            conn.send(('run', bound, inbox))
+        self.inbox = [[] for _ in self.conns]
+        for rank, conn in enumerate(self.conns):
+            outbox, self.next_times[rank], self.message_counts[rank], self.queue_depths[rank], self.times[rank] = \
+                self.reply(conn)
+            for m in outbox:
+                self.inbox[self.owner.get(m[3], 0)].append(m)
+
+    def message_count(self):
+        return sum(self.message_counts)
+
+    def time(self):
+        # Time stamp of the last event any worker dispatched
+        return max(self.times)
+
+    def queue_depth(self):
+        return sum(self.queue_depths) + sum(len(inbox) for inbox in self.inbox)
+
+    def call(self, time_stamp, node, method, *args):
+        conn = self.conns[self.owner.get(node, 0)]
+        conn.send(('call', time_stamp, node, method, args))
+        return self.reply(conn)[0]
+
+    def queue_str(self):
+        ans = ""
+        for conn in self.conns:
+            conn.send(('queue',))
+            ans += self.reply(conn)[0]
+        return ans
+
+    def recording(self, rank):
+        return None if self.record is None else "%s.part%d" % (self.record, rank)
+
+    def recordings(self):
+        # Recordings the workers have written, call after close
+        return [self.recording(rank) for rank in range(len(self.conns))
+                if self.record is not None and os.path.exists(self.recording(rank))]
+
+    def close(self):
+        message_count = 0
+        for conn in self.conns:
+            try:
+                conn.send(('stop',))
+                message_count += self.reply(conn)[0]
+            except (OSError, EOFError, RuntimeError):
+                pass
+        for p in self.procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        return message_count
+
+
+class Remote_Node:
+    """Stand-in on the coordinator for a node hosted by a partition worker."""
+
+    def __init__(self, sim, id):
+        self.sim = sim
+        self.id = id
+        self.index = sim.intern(id)
+
+    def __str__(self):
+        return self.sim.pool.call(self.sim.get_time(), self.id, '__str__')
+
+    def link_has_been_updated(self, neighbor, latency):
+        # The owning partition delivers this one
+        pass
+
+    def get_next_hop(self, destination):
+        return self.sim.pool.call(self.sim.get_time(), self.id, 'get_next_hop', destination)
+
+    def get_routing_table(self):
+        return self.sim.pool.call(self.sim.get_time(), self.id, 'get_routing_table')
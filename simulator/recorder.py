@@ -0,0 +1,161 @@
+import json
+import struct
+import numpy as np
+
+from simulator.config import *
+
+
+# Binary recording of every dispatched event.
+#
+# File layout: RECORDING_MAGIC, a little endian uint32 header length, a JSON header
+# ({"types": [...], "scenario": ..., "algorithm": ...}) padded so records start on a
+# RECORD.size boundary, then fixed width records:
+#
+#     time (int64), src (int64), dst (int64), size (uint32), type (uint8), 3 pad bytes
+#
+# For routing messages src is the sender, dst the receiver and size the message length in characters
+# (len of the string, the same as bytes for the ASCII messages the nodes send).
+# Other events use their node arguments as src / dst (-1 when absent) and size 0
+# (PRINT: length of the text, DATA_PACKET_ARRIVAL: packets in the batch). Types are indices into header["types"].
+
+RECORDING_MAGIC = b'RSIMREC1'
+
+RECORD = struct.Struct('<qqqIB3x')
+
+RECORD_DTYPE = np.dtype([('time', '<i8'), ('src', '<i8'), ('dst', '<i8'),
+                         ('size', '<u4'), ('type', 'u1'), ('pad', 'V3')])
+
+RECORD_TYPES = [
+    EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL,
+    EVENT_TYPE.SEND_LINK,
+    EVENT_TYPE.ADD_NODE,
+    EVENT_TYPE.ADD_LINK,
+    EVENT_TYPE.DELETE_NODE,
+    EVENT_TYPE.DELETE_LINK,
+    EVENT_TYPE.CHANGE_LINK,
+    EVENT_TYPE.PRINT,
+    EVENT_TYPE.DRAW_TOPOLOGY,
+    EVENT_TYPE.DRAW_PATH,
+    EVENT_TYPE.DRAW_TREE,
+    EVENT_TYPE.DUMP_NODE,
+    EVENT_TYPE.DUMP_SIM,
+    EVENT_TYPE.EXPORT_ROUTES,
+    EVENT_TYPE.SEND_TRAFFIC,
+    EVENT_TYPE.INJECT_TRAFFIC,
+    EVENT_TYPE.DATA_PACKET_ARRIVAL
+]
+
+TOPOLOGY_CHANGES = [EVENT_TYPE.ADD_LINK, EVENT_TYPE.DELETE_NODE, EVENT_TYPE.DELETE_LINK, EVENT_TYPE.CHANGE_LINK]
+
+
+class Event_Recorder:
+
+    def __init__(self, filename, scenario=None, algorithm=None, buffer_records=65536):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.codes = {event_type: i for i, event_type in enumerate(RECORD_TYPES)}
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+        self.count = 0
+
+        header = json.dumps({"types": RECORD_TYPES, "scenario": scenario, "algorithm": algorithm}).encode()
+        start = len(RECORDING_MAGIC) + 4 + len(header)
+        header += b' ' * (-start % RECORD.size)
+        self.file.write(RECORDING_MAGIC + struct.pack('<I', len(header)) + header)
+
+    def record(self, e):
+        if e.event_type == EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL:
+            src, dst, size = e.sender, e.arg1, len(e.arg2)
+        elif e.event_type == EVENT_TYPE.PRINT:
+            src, dst, size = -1, -1, len(e.arg1)
+        elif e.event_type == EVENT_TYPE.DATA_PACKET_ARRIVAL:
+            src, dst, size = e.arg1, e.arg2, e.arg3[1]
+        else:
+            src, dst, size = e.arg1, e.arg2, 0
+        RECORD.pack_into(self.buffer, self.offset, e.time_stamp, src, dst, size, self.codes.get(e.event_type, 255))
+        self.offset += RECORD.size
+        self.count += 1
+        if self.offset == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(memoryview(self.buffer)[:self.offset])
+        self.offset = 0
+
+    def append(self, filename):
+        # Add the records of another recording (e.g. of a partition worker)
+        self.flush()
+        recording = Recording(filename)
+        self.file.write(recording.records.tobytes())
+        self.count += len(recording.records)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class Recording:
+    """A recording memory mapped as a NumPy record array, see the layout at the top."""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+                raise ValueError("%s is not a simulator recording" % filename)
+            length, = struct.unpack('<I', f.read(4))
+            self.header = json.loads(f.read(length))
+        offset = len(RECORDING_MAGIC) + 4 + length
+        self.types = self.header["types"]
+        self.records = np.memmap(filename, dtype=RECORD_DTYPE, mode='r', offset=offset)
+
+    def of_type(self, *event_types):
+        codes = [self.types.index(t) for t in event_types]
+        return self.records[np.isin(self.records['type'], codes)]
+
+    def node_traffic(self):
+        """Per node: messages and characters sent, messages and characters received. Returns {node: (sent, sent_chars, received, received_chars)}."""
+        m = self.of_type(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL)
+        nodes = np.union1d(m['src'], m['dst'])
+        sent = np.zeros(len(nodes), dtype=np.int64)
+        sent_chars = np.zeros(len(nodes), dtype=np.int64)
+        received = np.zeros(len(nodes), dtype=np.int64)
+        received_chars = np.zeros(len(nodes), dtype=np.int64)
+        src = np.searchsorted(nodes, m['src'])
+        dst = np.searchsorted(nodes, m['dst'])
+        np.add.at(sent, src, 1)
+        np.add.at(sent_chars, src, m['size'])
+        np.add.at(received, dst, 1)
+        np.add.at(received_chars, dst, m['size'])
+        return {int(node): (int(sent[i]), int(sent_chars[i]), int(received[i]), int(received_chars[i]))
+                for i, node in enumerate(nodes)}
+
+    def link_load(self):
+        """Per undirected link: messages and characters carried. Returns {(node1, node2): (messages, characters)}, node1 < node2."""
+        m = self.of_type(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL)
+        pairs = np.stack([np.minimum(m['src'], m['dst']), np.maximum(m['src'], m['dst'])], axis=1)
+        links, index, counts = np.unique(pairs, axis=0, return_inverse=True, return_counts=True)
+        sizes = np.zeros(len(links), dtype=np.int64)
+        np.add.at(sizes, index.reshape(-1), m['size'])
+        return {(int(l[0]), int(l[1])): (int(counts[i]), int(sizes[i])) for i, l in enumerate(links)}
+
+    def convergence(self):
+        """
+        For every time with a topology change: [(time, changes, messages until the next change,
+        time of the last of those messages)]. Convergence time is the last message time minus the change time.
+        """
+        change_times = self.of_type(*TOPOLOGY_CHANGES)['time']
+        changes, change_counts = np.unique(change_times, return_counts=True)
+        message_times = np.sort(self.of_type(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL)['time'])
+        # Messages at time t belong to the latest change at or before t: change i owns the sorted
+        # messages from its own time up to the next change's
+        starts = np.searchsorted(message_times, changes, side='left')
+        ends = np.append(starts[1:], len(message_times))
+        counts = ends - starts
+        return [(int(t), int(change_counts[i]), int(counts[i]), int(message_times[ends[i] - 1]) if counts[i] else None)
+                for i, t in enumerate(changes)]
+
+    def message_histogram(self, bucket):
+        """Number of routing messages delivered in each `bucket` long time interval, starting at time 0."""
+        times = self.of_type(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL)['time']
+        if len(times) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.bincount(times // bucket)
@@ -0,0 +1,217 @@
+import os
+import json
+import random
+import hashlib
+import logging
+import queue
+import multiprocessing
+import networkx as nx
+import matplotlib.pyplot as plt
+
+from simulator.config import *
+
+
+# Drawing of DRAW_TOPOLOGY / DRAW_PATH / DRAW_TREE.
+#
+# The topology hands over a snapshot: a plain dict with the nodes, the links (node1, node2, latency),
+# the highlighted nodes and edges and the file name to write. Interactive runs draw it right away
+# and show the window. NO_STOP runs send it to a background process so the simulation does not wait
+# for layout and PNG encoding; when that process falls RENDER_QUEUE_SIZE snapshots behind, new
+# snapshots are dropped (RENDER_POLICY = 'drop', the default) or the simulation waits for room
+# ('block'). Waiting stops when the process has died, and the end of the run waits at most
+# RENDER_TIMEOUT seconds for it, so a crashed or stuck drawing process never hangs the simulation.
+#
+# Layouts are incremental: when nodes come or go, the remaining nodes keep their place, new nodes
+# start next to their neighbors and spring_layout only runs LAYOUT_REFINE_ITERATIONS from there.
+# Each layout is also stored under LAYOUT_CACHE_PATH, keyed by the event file and the node set,
+# so running the same scenario again reuses it. The cache keeps the LAYOUT_CACHE_SIZE most recently
+# used layouts. Layouts are seeded from the key, the same scenario always gets the same picture.
+
+
+def draw(snapshot, position, ax):
+    g = nx.Graph()
+    g.add_nodes_from(snapshot['nodes'])
+    g.add_weighted_edges_from(snapshot['edges'], weight='latency')
+    node_labels = {node: str(node) for node in snapshot['nodes']}
+    edge_labels = {(node1, node2): latency for node1, node2, latency in snapshot['edges']}
+
+    if snapshot['red_nodes'] is None:
+        nx.draw_networkx_nodes(g, position, node_size=600, node_color='b', alpha=0.7, ax=ax)
+    else:
+        nx.draw_networkx_nodes(g, position, nodelist=snapshot['blue_nodes'], node_size=600, node_color='b', alpha=0.7, ax=ax)
+        nx.draw_networkx_nodes(g, position, nodelist=snapshot['red_nodes'], node_size=700, node_color='r', alpha=0.6, ax=ax)
+    nx.draw_networkx_labels(g, position, labels=node_labels, font_size=14, font_color='w', ax=ax)
+
+    nx.draw_networkx_edges(g, position, width=2, alpha=0.5, ax=ax)
+    if snapshot['user_edges'] is not None:
+        nx.draw_networkx_edges(g, position, edgelist=list(snapshot['user_edges']), width=6, edge_color='r', alpha=0.4, ax=ax)
+    if snapshot['correct_edges'] is not None:
+        nx.draw_networkx_edges(g, position, edgelist=list(snapshot['correct_edges']), width=3, edge_color='g', alpha=0.8, ax=ax)
+    nx.draw_networkx_edge_labels(g, position, edge_labels=edge_labels, font_size=14, ax=ax)
+    ax.axis('off')
+
+
+def layout_key(scenario, nodes):
+    return hashlib.sha1(repr((scenario, sorted(nodes))).encode()).hexdigest()
+
+
+def layout_cache_file(key):
+    return os.path.join(LAYOUT_CACHE_PATH, key + '.json')
+
+
+def load_layout(filename):
+    try:
+        with open(filename) as f:
+            position = {node: (x, y) for node, x, y in json.load(f)}
+        # Mark it as recently used
+        os.utime(filename)
+        return position
+    except (OSError, ValueError):
+        return None
+
+
+def save_layout(filename, position):
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump([[node, float(x), float(y)] for node, (x, y) in position.items()], f)
+        os.replace(filename + '.tmp', filename)
+        evict_layouts(os.path.dirname(filename))
+    except OSError as e:
+        logging.getLogger('Render').warning("Cannot store layout %s: %s" % (filename, e))
+
+
+def evict_layouts(directory, size=LAYOUT_CACHE_SIZE):
+    """Delete the least recently used layouts beyond `size`."""
+    cached = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            try:
+                cached.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+    cached.sort()
+    for _, path in cached[:max(0, len(cached) - size)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def incremental_layout(g, previous, seed=None):
+    """Keep the previous positions, put new nodes next to their placed neighbors, then refine briefly."""
+    rng = random.Random(seed)
+    if not previous:
+        return nx.spring_layout(g, seed=rng.randrange(2 ** 32))
+
+    start = {node: previous[node] for node in g.nodes if node in previous}
+    for node in g.nodes:
+        if node in start:
+            continue
+        placed = [start[neighbor] for neighbor in g[node] if neighbor in start]
+        if placed:
+            x = sum(p[0] for p in placed) / len(placed)
+            y = sum(p[1] for p in placed) / len(placed)
+        else:
+            x, y = rng.uniform(-1, 1), rng.uniform(-1, 1)
+        start[node] = (x + rng.uniform(-0.05, 0.05), y + rng.uniform(-0.05, 0.05))
+    return nx.spring_layout(g, pos=start, iterations=LAYOUT_REFINE_ITERATIONS, seed=rng.randrange(2 ** 32))
+
+
+class Renderer:
+    """Draws snapshots in the simulation thread and shows them, for the interactive step modes."""
+
+    def __init__(self):
+        self.position = None
+        self.position_nodes = None
+
+    def layout(self, snapshot):
+        # Keep the layout until a node is added or deleted
+        nodes = frozenset(snapshot['nodes'])
+        if self.position is None or nodes != self.position_nodes:
+            key = layout_key(snapshot['scenario'], nodes)
+            # Generated event streams have no file to key the cache with
+            filename = None if snapshot['scenario'] is None else layout_cache_file(key)
+            position = None if filename is None else load_layout(filename)
+            if position is None:
+                g = nx.Graph()
+                g.add_nodes_from(snapshot['nodes'])
+                g.add_weighted_edges_from(snapshot['edges'], weight='latency')
+                position = incremental_layout(g, self.position, key)
+                if filename is not None:
+                    save_layout(filename, position)
+            self.position = position
+            self.position_nodes = nodes
+        return self.position
+
+    def submit(self, snapshot):
+        fig = plt.figure()
+        draw(snapshot, self.layout(snapshot), fig.gca())
+        fig.savefig(OUTPUT_PATH + snapshot['filename'])  # call savefig before show
+        plt.show()
+        plt.close(fig)
+
+    def close(self):
+        return 0
+
+
+def render_worker(snapshots):
+    from matplotlib.figure import Figure
+    renderer = Renderer()
+    while True:
+        snapshot = snapshots.get()
+        if snapshot is None:
+            break
+        try:
+            fig = Figure()
+            draw(snapshot, renderer.layout(snapshot), fig.add_subplot())
+            fig.savefig(OUTPUT_PATH + snapshot['filename'])
+        except Exception:
+            logging.getLogger('Render').exception("Cannot draw %s" % snapshot['filename'])
+
+
+class Background_Renderer:
+    """Draws snapshots in a worker process, see the comment at the top."""
+
+    def __init__(self, size=RENDER_QUEUE_SIZE, policy=RENDER_POLICY):
+        ctx = multiprocessing.get_context()
+        self.policy = policy
+        self.dropped = 0
+        self.snapshots = ctx.Queue(size)
+        self.process = ctx.Process(target=render_worker, args=(self.snapshots,), daemon=True)
+        self.process.start()
+
+    def submit(self, snapshot):
+        if self.policy == 'block' and self.put(snapshot):
+            return
+        try:
+            self.snapshots.put_nowait(snapshot)
+        except queue.Full:
+            self.dropped += 1
+
+    def put(self, item, timeout=None):
+        # Wait for room while the process lives, at most `timeout` seconds; False when there was none
+        waited = 0
+        while self.process.is_alive() and (timeout is None or waited < timeout):
+            try:
+                self.snapshots.put(item, timeout=RENDER_POLL)
+                return True
+            except queue.Full:
+                waited += RENDER_POLL
+        return False
+
+    def close(self, timeout=RENDER_TIMEOUT):
+        # Wait for the snapshots already queued, returns how many were dropped
+        if self.put(None, timeout):
+            self.process.join(timeout)
+        if self.process.is_alive():
+            logging.getLogger('Render').warning("Drawing process did not finish within %d s, stopping it" % timeout)
+            self.process.terminate()
+            self.process.join()
+        elif self.process.exitcode != 0:
+            logging.getLogger('Render').warning("Drawing process failed (exit code %d), queued drawings are lost"
+                                                % self.process.exitcode)
+        if self.process.exitcode != 0:
+            # Snapshots nobody will read must not keep this process from exiting
+            self.snapshots.cancel_join_thread()
+        return self.dropped
@@ -1,148 +1,361 @@
+import os
 import sys
 import logging
 import traceback
 import time
 import networkx as nx
-import matplotlib.pyplot as plt
 
 from simulator.config import *
-from simulator.event import Event
+from simulator.event import Event, make_event
 from simulator.event_queue import Event_Queue
+from simulator.render import Renderer, Background_Renderer
+from simulator.export import write_routes
+from simulator.event_cache import load_compiled, save_compiled
+from simulator.tracing import Trace_Flags
+from simulator.traffic import Traffic
 
 
 class Topology:
 
-    Nodes = {}
-    this = None
-
-    def __init__(self, algorithm, step='NORMAL'):
-        self.__g = nx.Graph()
+    def __init__(self, algorithm, step='NORMAL', trace=None):
+        # node -> {neighbor -> latency}, in insertion order like networkx would keep it
+        self.__adj = {}
+        # (node, neighbor) -> bytes per time unit for links that have one, and when the
+        # messages queued on that direction will have been sent
+        self.__bandwidth = {}
+        self.__busy_until = {}
+        self.__nx = None
+        # Routing table snapshot and memoized user paths, see get_user_path
+        self.__routes = None
+        self.__walks = None
         self.node_cls = ROUTE_ALGORITHM_NODE[algorithm]
         self.step = step
         self.logging = logging.getLogger('Sim')
-        self.position = None
+        # Trace categories of this simulation, all off unless given, see simulator/tracing.py
+        self.trace = Trace_Flags() if trace is None else trace
+        self.renderer = None
+        self.scenario = None
         self.message_count = 0
         self.print_count = 0
-        Topology.Nodes = {}
-        Topology.this = self
+        self.nodes = {}
+        self.event_queue = Event_Queue()
+        self.send_link_count = 0
+        self.sent_count = {}
+        self.shared_state = {}
+        # Data plane, from the first SEND_TRAFFIC on
+        self.traffic = None
+        # Node id <-> dense index 0..n-1, in the order nodes first appear; an id keeps its index
+        # for the whole simulation, also after DELETE_NODE, so arrays indexed by it stay valid
+        self.node_index = {}
+        self.node_ids = []
 
     def __str__(self):
         ans = ""
-        for node in self.__g.nodes:
+        for node, links in self.__adj.items():
             ans += "node " + str(node) + ": "
-            ans += str(self.__g[node])
+            ans += str({neighbor: {'latency': latency} for neighbor, latency in links.items()})
             ans += "\n"
         return ans
 
-    def add_node(self, node):
-        if node not in Topology.Nodes.keys():
-            self.position = None
-            Topology.Nodes[node] = self.node_cls(node)
-        self.__g.add_node(node)
+    def edges(self):
+        # Every link once, in the order networkx reports them
+        seen = set()
+        for node, links in self.__adj.items():
+            for neighbor in links:
+                if neighbor not in seen:
+                    yield node, neighbor
+            seen.add(node)
+
+    def graph(self):
+        # A networkx copy of the topology, only built for drawing and the reference shortest paths
+        if self.__nx is None:
+            self.__nx = nx.Graph()
+            self.__nx.add_nodes_from(self.__adj)
+            self.__nx.add_weighted_edges_from(self.linked_edges(), weight='latency')
+        return self.__nx
+
+    def linked_edges(self):
+        # (node, neighbor, latency) for every link, in an order that lists each node's neighbors in the
+        # order of __adj, i.e. the order they were linked in. A graph built link by link has the same
+        # adjacency, so networkx breaks shortest path ties and orders its results the same way.
+        head = {node: iter(neighbors) for node, neighbors in self.__adj.items()}
+        first = {node: next(head[node], None) for node in self.__adj}
+        ready = [(node, neighbor) for node, neighbor in first.items()
+                 if neighbor is not None and first[neighbor] == node and node <= neighbor]
+        while ready:
+            node, neighbor = ready.pop()
+            yield node, neighbor, self.__adj[node][neighbor]
+            for end in {node, neighbor}:
+                first[end] = following = next(head[end], None)
+                if following is not None and first[following] == end:
+                    ready.append((end, following))
+
+    def get_time(self):
+        return self.event_queue.Get_Current_Time()
+
+    def intern(self, node):
+        # The dense index of a node id, giving new ids the next free index
+        index = self.node_index.get(node)
+        if index is None:
+            index = self.node_index[node] = len(self.node_ids)
+            self.node_ids.append(node)
+        return index
+
+    def index_of(self, node):
+        return self.node_index[node]
+
+    def id_of(self, index):
+        return self.node_ids[index]
+
+    def create_node(self, node):
+        # Bind the node to this simulation before __init__ runs, since
+        # constructors are allowed to call get_time() and friends.
+        n = self.node_cls.__new__(self.node_cls)
+        n.sim = self
+        n.index = self.intern(node)
+        n.__init__(node)
+        return n
+
+    def shared(self, name, factory):
+        # One object per simulation that nodes can share, such as a common link state database
+        if name not in self.shared_state:
+            self.shared_state[name] = factory()
+        return self.shared_state[name]
+
+    def owns(self, node):
+        # Whether this topology hosts the node object, a partition of a parallel run only hosts some
+        return True
 
-    def add_link(self, node1, node2, latency):
+    def add_node(self, node):
+        self.intern(node)
+        if node not in self.__adj:
+            self.__nx = None
+            self.__routes = None
+            self.__adj[node] = {}
+        if node not in self.nodes.keys() and self.owns(node):
+            self.nodes[node] = self.create_node(node)
+            if self.trace.topology:
+                self.trace.topology("node %d added at time %d", node, self.get_time())
+
+    def add_link(self, node1, node2, latency, bandwidth=-1):
         if latency < 0:
             sys.stderr.write("Latency of a link cannot be negative.")
             sys.exit(-1)
+        if bandwidth == 0 or bandwidth < -1:
+            sys.stderr.write("Bandwidth of a link must be positive.")
+            sys.exit(-1)
         self.add_node(node1)
         self.add_node(node2)
-        self.__g.add_edge(node1, node2, latency = latency)
+        self.__adj[node1][node2] = latency
+        self.__adj[node2][node1] = latency
+        if bandwidth == -1:
+            self.__bandwidth.pop((node1, node2), None)
+            self.__bandwidth.pop((node2, node1), None)
+        else:
+            self.__bandwidth[node1, node2] = bandwidth
+            self.__bandwidth[node2, node1] = bandwidth
+        if self.trace.topology:
+            self.trace.topology("link (%d, %d) latency %d at time %d", node1, node2, latency, self.get_time())
+        self.__nx = None
+        self.__routes = None
         self.post_send_link(node1, node2, latency)
         self.post_send_link(node2, node1, latency)
 
-    def change_link(self, node1, node2, latency):
-        self.add_link(node1, node2, latency)
+    def change_link(self, node1, node2, latency, bandwidth=-1):
+        # Without a bandwidth the link keeps the one it had
+        if bandwidth == -1:
+            bandwidth = self.__bandwidth.get((node1, node2), -1)
+        self.add_link(node1, node2, latency, bandwidth)
 
     def send_link(self, node, neighbor, latency):
-        if node not in Topology.Nodes:
+        if node not in self.nodes:
             return
-        Topology.Nodes[node].link_has_been_updated(neighbor, latency)
+        self.__routes = None
+        self.nodes[node].link_has_been_updated(neighbor, latency)
+        if self.traffic is not None:
+            self.traffic.invalidate(node)
 
     def post_send_link(self, node, neighbor, latency):
-        Event_Queue.Post(
+        self.event_queue.Post(
             Event(
-                Get_Time(),
+                self.get_time(),
                 EVENT_TYPE.SEND_LINK,
-                self,
                 node,
                 neighbor,
-                latency
+                latency,
+                seq=self.send_link_count
             )
         )
+        self.send_link_count += 1
 
     def delete_link(self, node1, node2):
-        if (node1, node2) in self.__g.edges:
-            self.__g.remove_edge(node1, node2)
+        if node2 in self.__adj.get(node1, ()):
+            del self.__adj[node1][node2]
+            self.__adj[node2].pop(node1, None)
+            for link in ((node1, node2), (node2, node1)):
+                self.__bandwidth.pop(link, None)
+                self.__busy_until.pop(link, None)
+            self.__nx = None
+            self.__routes = None
             self.post_send_link(node1, node2, -1)
             self.post_send_link(node2, node1, -1)
+            if self.trace.topology:
+                self.trace.topology("link (%d, %d) deleted at time %d", node1, node2, self.get_time())
         else:
             self.logging.warning("remove link (%d, %d) does not exit" % (node1, node2))
 
     def delete_node(self, node):
-        if node in self.__g.nodes:
-            for neighbor in list(self.__g[node].keys()):
+        if node in self.__adj:
+            for neighbor in list(self.__adj[node].keys()):
                 self.delete_link(node, neighbor)
-            self.__g.remove_node(node)
-            Topology.Nodes.pop(node)
-            self.position = None
-            self.logging.debug("node %d deleted at time %d" % (node, Get_Time()))
+            del self.__adj[node]
+            self.__nx = None
+            self.__routes = None
+            self.nodes.pop(node, None)
+            if self.traffic is not None:
+                self.traffic.invalidate(node)
+            if self.trace.topology:
+                self.trace.topology("node %d deleted at time %d", node, self.get_time())
         else:
             self.logging.warning("remove node %d does not exit" % node)
 
     def dump_node(self, node):
-        if (node in self.__g.nodes) and (node in Topology.Nodes.keys()):
-            self.logging.info('DUMP_NODE: ' + str(Topology.Nodes[node]))
+        if (node in self.__adj) and (node in self.nodes.keys()):
+            self.logging.info('DUMP_NODE: ' + str(self.nodes[node]))
         else:
             self.logging.warning("node %d does not exit" % node)
 
+    def latency(self, node, neighbor):
+        # Latency of the link, None when there is none
+        return self.__adj.get(node, {}).get(neighbor)
+
+    def bandwidth(self, node, neighbor):
+        # Bandwidth of the link, None when it has none (no serialization delay)
+        return self.__bandwidth.get((node, neighbor))
+
+    def link_delay(self, node, neighbor, latency, m):
+        """
+        Time from now until m, sent now, arrives. Over a link with a bandwidth the message first waits
+        for the ones sent before it in the same direction, then takes ceil(size / bandwidth) to send.
+        """
+        if not self.__bandwidth:
+            return latency
+        bandwidth = self.__bandwidth.get((node, neighbor))
+        if bandwidth is None:
+            return latency
+        now = self.get_time()
+        sent = max(now, self.__busy_until.get((node, neighbor), now)) - (-len(m) // bandwidth)
+        self.__busy_until[node, neighbor] = sent
+        return sent - now + latency
+
     def send_to_neighbors(self, node, m):
-        for neighbor in list(self.__g[node].keys()):
+        for neighbor in list(self.__adj[node].keys()):
             self.send_to_neighbor(node, neighbor, m)
 
     def send_to_neighbor(self, node, neighbor, m):
-        if (node, neighbor) not in self.__g.edges:
+        latency = self.__adj.get(node, {}).get(neighbor)
+        if latency is None:
             return
-        Event_Queue.Post(
+        seq = self.sent_count.get(node, 0)
+        self.sent_count[node] = seq + 1
+        if type(m) is str:
+            # Equal payloads (a flood, a re-encoded advertisement) share one string while pending
+            m = sys.intern(m)
+        if self.__bandwidth:
+            latency = self.link_delay(node, neighbor, latency, m)
+        self.post_routing_message(
             Event(
-                Get_Time() + int(self.__g[node][neighbor]['latency']),
+                self.get_time() + latency,
                 EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL,
-                self,
                 neighbor,
-                m
+                m,
+                sender=node,
+                seq=seq
             )
         )
 
+    def post_routing_message(self, e):
+        self.event_queue.Post(e)
+
     def routing_message_arrival(self, neighbor, m):
         self.message_count += 1
-        if neighbor in self.__g.nodes:
-            Topology.Nodes[neighbor].process_incoming_routing_message(m)
-
-    def node_labels(self):
-        return {node : str(node) for node in self.__g.nodes}
+        if neighbor in self.__adj:
+            self.__routes = None
+            self.nodes[neighbor].process_incoming_routing_message(m)
+            if self.traffic is not None:
+                self.traffic.invalidate(neighbor)
+
+    def send_traffic(self, src, dst, rate):
+        if self.traffic is None:
+            # Flows run until the last command of the event file
+            end = max((e.time_stamp for e in self.event_queue if EVENT_RANK.get(e.event_type, 0) == 0), default=self.get_time())
+            self.traffic = Traffic(self, end)
+        self.traffic.send_traffic(src, dst, rate)
+
+    def inject_traffic(self, src, dst, generation):
+        self.traffic.inject(src, dst, generation)
+
+    def data_packet_arrival(self, node, dst, batch):
+        self.traffic.forward(node, dst, batch)
+
+    def snapshot(self, red_nodes=None, blue_nodes=None, correct_edges=None, user_edges=None):
+        filename = 'Topo_' + time.strftime("%H_%M_%S", time.localtime()) + '_Count_' + str(self.print_count) + '_Time_' + str(self.get_time()) + '.png'
+        self.print_count += 1
+        return {
+            'filename': filename,
+            'scenario': self.scenario,
+            'nodes': list(self.__adj),
+            'edges': [(node1, node2, self.__adj[node1][node2]) for node1, node2 in self.edges()],
+            'red_nodes': red_nodes,
+            'blue_nodes': blue_nodes,
+            'correct_edges': correct_edges,
+            'user_edges': user_edges
+        }
+
+    def render(self, snapshot):
+        if self.renderer is None:
+            self.renderer = Background_Renderer() if self.step == 'NO_STOP' else Renderer()
+        self.renderer.submit(snapshot)
+        self.wait()
 
-    def edge_labels(self):
-        return {(node1, node2) : self.__g[node1][node2]['latency'] for node1, node2 in self.__g.edges}
+    def close_renderer(self):
+        if self.renderer is not None:
+            dropped = self.renderer.close()
+            if dropped > 0:
+                self.logging.warning("Rendering fell behind, %d drawings were skipped" % dropped)
+            self.renderer = None
 
     def draw_topology(self):
-        if self.position == None:
-            self.position = nx.spring_layout(self.__g)
-        nx.draw_networkx_nodes(self.__g, self.position, node_size=600, node_color='b', alpha=0.7)
-        nx.draw_networkx_labels(self.__g, self.position, labels=self.node_labels(), font_size=14, font_color='w')
-        nx.draw_networkx_edges(self.__g, self.position, width=2, alpha=0.5)
-        nx.draw_networkx_edge_labels(self.__g, self.position, edge_labels=self.edge_labels(), font_size=14)
-        plt.axis('off')
-
-        filename = 'Topo_' + time.strftime("%H_%M_%S", time.localtime()) + '_Count_' + str(self.print_count) + '_Time_' + str(Get_Time()) + '.png'
-        self.print_count += 1
-        plt.savefig(OUTPUT_PATH + filename) # call savefig before show
-        plt.show()
-        plt.close(OUTPUT_PATH + filename)
-        self.wait()
+        self.render(self.snapshot())
+
+    def routing_table(self, node):
+        # {destination: (next hop, cost)} of one node, asking get_next_hop() when it has no get_routing_table()
+        table = self.nodes[node].get_routing_table()
+        if table is None:
+            table = {}
+            for destination in self.__adj:
+                if destination != node:
+                    next = self.nodes[node].get_next_hop(destination)
+                    if next is not None and next != -1:
+                        table[destination] = (next, float('inf'))
+        return table
+
+    def export_routes(self, filename=None):
+        # Every node's routing table and the reference distances, see simulator/export.py
+        if filename is None:
+            filename = OUTPUT_PATH + 'Routes_Count_' + str(self.print_count) + '_Time_' + str(self.get_time()) + '.npz'
+            self.print_count += 1
+        # One source at a time, tables and distances are not kept for all nodes at once
+        graph = self.graph()
+        write_routes(filename, self.get_time(), sorted(self.__adj),
+                     lambda node: self.routing_table(node) if node in self.nodes else {},
+                     lambda node: nx.single_source_dijkstra_path_length(graph, node, weight='latency'))
+        self.logging.info("EXPORT_ROUTES at Time %d to %s" % (self.get_time(), filename))
 
     def get_correct_path(self, source, destination):
         try:
-            shortest_path = nx.algorithms.shortest_path(self.__g, source=source, target=destination, weight='latency')
-            shortest_length = nx.algorithms.shortest_path_length(self.__g, source=source, target=destination, weight='latency')
+            shortest_path = nx.algorithms.shortest_path(self.graph(), source=source, target=destination, weight='latency')
+            shortest_length = nx.algorithms.shortest_path_length(self.graph(), source=source, target=destination, weight='latency')
         except:
             self.logging.warning("No path from %d to %d, please correct event/topo file" % (source, destination))
             return None, float("inf")
@@ -151,8 +364,8 @@ class Topology:
 
     def get_correct_path_dict(self, source):
         try:
-            shortest_paths = nx.algorithms.shortest_path(self.__g, source=source, weight='latency')
-            shortest_lengths = nx.algorithms.shortest_path_length(self.__g, source=source, weight='latency')
+            shortest_paths = nx.algorithms.shortest_path(self.graph(), source=source, weight='latency')
+            shortest_lengths = nx.algorithms.shortest_path_length(self.graph(), source=source, weight='latency')
         except:
             self.logging.warning("No Tree from %d, please correct event/topo file" % source)
             return None, float("inf")
@@ -161,32 +374,75 @@ class Topology:
         return shortest_path_dict, shortest_length_dict
 
 
+    def forget_routes(self):
+        # Called whenever node state or the graph may have changed
+        self.__routes = None
+
+    def next_hop(self, node, destination):
+        # Answers from one routing table snapshot per node, nodes without get_routing_table are asked directly
+        if node not in self.__routes:
+            self.__routes[node] = self.nodes[node].get_routing_table()
+        table = self.__routes[node]
+        if table is None:
+            return self.nodes[node].get_next_hop(destination)
+        if destination not in table:
+            return -1
+        return table[destination][0]
+
     def get_user_path(self, source, destination):
-        path = [source]
-        length = 0
+        # Walks are memoized per destination until the simulation moves on: a walk that reaches a node
+        # whose outcome is known reuses that suffix. Successes and dead ends do not depend on how a node
+        # was reached, loops do (the output stops at the first repeat), so loops are not memoized.
+        if self.__routes is None:
+            self.__routes, self.__walks = {}, {}
+        walks = self.__walks.setdefault(destination, {})
 
-        while destination not in path:
-            next = Topology.Nodes[path[-1]].get_next_hop(destination)
+        path = [source]
+        on_path = {source}
+        lengths = [0]
+        failure = None
+        node = source
+        while node != destination and node not in walks:
+            next = self.next_hop(node, destination)
             if next == None:
-                self.logging.warning("Your algorithm cannot find a path from %d to %d. Output: %s." % (source, destination, str(path)))
-                return [], float("inf")
-            elif next == -1 or next not in self.__g.nodes or next in path:
+                failure = 'no path'
+            elif next == -1 or next not in self.__adj or next in on_path:
+                failure = 'loop' if next in on_path else 'no path'
                 path.append(next)
-                self.logging.warning(
-                    "Your algorithm cannot find a path from %d to %d. Output: %s." % (source, destination, str(path)))
-                return [], float("inf")
-            elif (path[-1], next) not in self.__g.edges:
-                self.logging.warning("Link from %d to %d does not exist, you cannot use it" % (path[-1], next))
+            elif next not in self.__adj[node]:
+                failure = 'no link'
                 path.append(next)
-                return [], float("inf")
-            length += self.__g[path[-1]][next]['latency']
+            if failure is not None:
+                break
+            lengths.append(lengths[-1] + self.__adj[node][next])
             path.append(next)
-        return path, length
+            on_path.add(next)
+            node = next
+
+        if failure is None and node != destination:
+            # Known suffix: (failure, path, index of the node in path, remaining length)
+            failure, suffix, i, remaining = walks[node]
+            path = path[:-1] + suffix[i:]
+            remaining += lengths[-1]
+        else:
+            remaining = lengths[-1]
+
+        if failure != 'loop':
+            for i in range(len(lengths)):
+                walks.setdefault(path[i], (failure, path, i, remaining - lengths[i]))
+
+        if failure == 'no link':
+            self.logging.warning("Link from %d to %d does not exist, you cannot use it" % (path[-2], path[-1]))
+            return [], float("inf")
+        elif failure is not None:
+            self.logging.warning("Your algorithm cannot find a path from %d to %d. Output: %s." % (source, destination, str(path)))
+            return [], float("inf")
+        return path, remaining
 
 
     def get_user_path_dict(self, source):
         path_dict, length_dict = {}, {}
-        for d in self.__g.nodes:
+        for d in self.__adj:
             if d == source: continue
             path_dict[(source, d)], length_dict[(source, d)] = self.get_user_path(source, d)
         return path_dict, length_dict
@@ -194,7 +450,7 @@ class Topology:
 
 
     def draw_path(self, source, destination):
-        if (source not in self.__g.nodes) or  (destination not in self.__g.nodes) or (source == destination):
+        if (source not in self.__adj) or  (destination not in self.__adj) or (source == destination):
             self.logging.warning("Parameters in DRAW_PATH are illegal.")
             return
 
@@ -209,7 +465,7 @@ class Topology:
         print("student's solution is %s!\n" % ("correct" if correct_length == user_length else "incorrect"))
 
         red_nodes = [source, destination]
-        blue_nodes = list(self.__g.nodes)
+        blue_nodes = list(self.__adj)
         for node in red_nodes:
             blue_nodes.remove(node)
 
@@ -221,7 +477,7 @@ class Topology:
 
 
     def draw_tree(self, source):
-        if source not in self.__g.nodes:
+        if source not in self.__adj:
             self.logging.warning("Parameter in DRAW_TREE is illegal.")
             return
 
@@ -240,7 +496,7 @@ class Topology:
         print("student's solution is %s!\n" % ("correct" if correct_length_dict == user_length_dict else "incorrect"))
 
         red_nodes = [source]
-        blue_nodes = list(self.__g.nodes)
+        blue_nodes = list(self.__adj)
         blue_nodes.remove(source)
 
         correct_edges, user_edges = set(), set()
@@ -252,35 +508,39 @@ class Topology:
         self.draw_in_networkx(red_nodes, blue_nodes, correct_edges, user_edges)
 
     def draw_in_networkx(self, red_nodes, blue_nodes, correct_path, user_path):
-        if self.position == None:
-            self.position = nx.spring_layout(self.__g)
-
-        nx.draw_networkx_nodes(self.__g, self.position, nodelist=blue_nodes, node_size=600, node_color='b', alpha=0.7)
-        nx.draw_networkx_nodes(self.__g, self.position, nodelist=red_nodes, node_size=700, node_color='r', alpha=0.6)
-        nx.draw_networkx_labels(self.__g, self.position, labels=self.node_labels(), font_size=14, font_color='w')
-
-        nx.draw_networkx_edges(self.__g, self.position, width=2, alpha=0.5)
-        if user_path != None:
-            nx.draw_networkx_edges(self.__g, self.position, edgelist=user_path, width=6, edge_color='r', alpha=0.4)
-        nx.draw_networkx_edges(self.__g, self.position, edgelist=correct_path, width=3, edge_color='g', alpha=0.8)
-        nx.draw_networkx_edge_labels(self.__g, self.position, edge_labels=self.edge_labels(), font_size=14)
-        plt.axis('off')
-
-        filename = 'Topo_' + time.strftime("%H_%M_%S", time.localtime()) + '_Count_' + str(self.print_count) + '_Time_' + str(Get_Time()) + '.png'
-        self.print_count += 1
-        plt.savefig(OUTPUT_PATH + filename)  # call savefig before show
-        plt.show()
-        plt.close(OUTPUT_PATH + filename)
-        self.wait()
+        self.render(self.snapshot(red_nodes, blue_nodes, correct_path, user_path))
 
     def wait(self):
         if self.step == 'NO_STOP':
             return
         input('Press Enter to Continue...')
 
+    def load(self, source):
+        # An event file name, or an iterable of (time, event type, args...) like generate_simulation.generate_events
+        if isinstance(source, str):
+            self.load_command_file(source)
+        else:
+            self.load_events(source)
+
+    def load_events(self, events):
+        loaded = [make_event(time_stamp, event_type, *args, seq=order)
+                  for order, (time_stamp, event_type, *args) in enumerate(events)]
+        self.event_queue.Extend(loaded)
+
     def load_command_file(self, file):
+        # Reuse the compiled copy of the file when it is up to date, see simulator/event_cache.py
+        self.scenario = os.path.abspath(file)
+        events = load_compiled(file)
+        if events is None:
+            events = self.parse_command_file(file)
+            save_compiled(file, events)
+        self.event_queue.Extend(events)
+
+    def parse_command_file(self, file):
+        events = []
         try:
             f = open(file)
+            order = 0
             for line in f.readlines():
                 line = line.strip()
                 if line == "" or line[0] == '#':
@@ -292,18 +552,22 @@ class Topology:
 
                 num_args = len(items) - 2
                 if event_type == EVENT_TYPE.PRINT:
-                    Event_Queue.Post(Event(time_stamp, event_type, self, "".join(items[2:])))
-                elif num_args < 0 or num_args > 3:
+                    events.append(Event(time_stamp, event_type, "".join(items[2:]), seq=order))
+                elif num_args < 0 or num_args > 4 or (num_args == 4 and event_type not in BANDWIDTH_EVENTS):
                     sys.stderr.write(line)
                     raise BufferError
                 elif num_args == 0:
-                    Event_Queue.Post(Event(time_stamp, event_type, self))
+                    events.append(Event(time_stamp, event_type, seq=order))
                 elif num_args == 1:
-                    Event_Queue.Post(Event(time_stamp, event_type, self, int(items[2])))
+                    events.append(Event(time_stamp, event_type, int(items[2]), seq=order))
                 elif num_args == 2:
-                    Event_Queue.Post(Event(time_stamp, event_type, self, int(items[2]), int(items[3])))
+                    events.append(Event(time_stamp, event_type, int(items[2]), int(items[3]), seq=order))
                 elif num_args == 3:
-                    Event_Queue.Post(Event(time_stamp, event_type, self, int(items[2]), int(items[3]), int(items[4])))
+                    events.append(Event(time_stamp, event_type, int(items[2]), int(items[3]), int(items[4]), seq=order))
+                elif num_args == 4:
+                    events.append(make_event(time_stamp, event_type, int(items[2]), int(items[3]), int(items[4]),
+                                             int(items[5]), seq=order))
+                order += 1
             f.close()
 
         except IOError as e:
@@ -321,12 +585,4 @@ class Topology:
             traceback.print_exc()
             sys.exit(-1)
 
-
-def Send_To_Neighbors(node, m):
-    Topology.this.send_to_neighbors(node.id, m)
-
-def Send_To_Neighbor(node, neighbor, m):
-    Topology.this.send_to_neighbor(node.id, neighbor, m)
-
-def Get_Time():
-    return Event_Queue.Current_Time
+        return events
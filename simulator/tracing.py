@@ -0,0 +1,60 @@
+import logging
+
+
+# Tracing.
+#
+# Debug output from hot paths (every link update, every message) goes through per category
+# tracers instead of eager logging calls. Every simulation has its own Trace_Flags (sim.trace) with
+# one attribute per category in TRACE_CATEGORIES: None while the category is off, a Tracer while it
+# is on. Call sites test it first, so a disabled category costs a few attribute lookups and no
+# argument is evaluated or formatted:
+#
+#     if self.sim.trace.node:
+#         self.sim.trace.node("link update, neighbor %d, latency %d", neighbor, latency)
+#
+# A Tracer passes the format and arguments to logging (logger 'Trace.<category>', INFO), which
+# only formats records it emits, and with sampling only emits every `sample`th call.
+#
+# Categories are turned on with Sim(..., trace=Trace_Flags(categories, sample)); sim.py --trace does
+# so, defaulting to TRACE_ENABLED and TRACE_SAMPLE in simulator/config.py. Worker processes get
+# settings() and build their own. This module does not import the config, which imports the node
+# classes that use it.
+#     node       node implementations (link updates, messages received)
+#     topology   nodes and links added or removed
+#     spf        shortest path tree repairs of LINK_STATE_INCREMENTAL
+
+TRACE_CATEGORIES = ('node', 'topology', 'spf')
+
+
+class Tracer:
+    __slots__ = ('logger', 'sample', 'count')
+
+    def __init__(self, category, sample=1):
+        self.logger = logging.getLogger('Trace.' + category)
+        self.sample = sample
+        self.count = 0
+
+    def __call__(self, message, *args):
+        self.count += 1
+        if self.count >= self.sample:
+            self.count = 0
+            self.logger.info(message, *args)
+
+
+class Trace_Flags:
+    """The categories turned on for one simulation, exactly `categories` ('all' for every one), emitting 1 in `sample` calls of each."""
+    __slots__ = TRACE_CATEGORIES + ('sample',)
+
+    def __init__(self, categories=(), sample=1):
+        if 'all' in categories:
+            categories = TRACE_CATEGORIES
+        for category in categories:
+            if category not in TRACE_CATEGORIES:
+                raise ValueError("Unknown trace category %s, expected one of %s" % (category, ", ".join(TRACE_CATEGORIES)))
+        for category in TRACE_CATEGORIES:
+            setattr(self, category, Tracer(category, sample) if category in categories else None)
+        self.sample = sample
+
+    def settings(self):
+        """The constructor arguments, to build the same flags in another process."""
+        return [category for category in TRACE_CATEGORIES if getattr(self, category) is not None], self.sample
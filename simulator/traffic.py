@@ -0,0 +1,143 @@
+import time
+
+from simulator.config import *
+from simulator.event import Event
+
+
+# Data plane (SEND_TRAFFIC events).
+#
+# `T SEND_TRAFFIC src dst rate` starts a flow of `rate` packets per time unit from src to dst at
+# time T; a later SEND_TRAFFIC for the same pair changes the rate, rate 0 stops the flow. Flows
+# end at the time of the last command in the event file, so a run still ends.
+#
+# Every TRAFFIC_INTERVAL a flow injects its packets at src as one batch. A batch is forwarded hop
+# by hop, each hop taking the link latency, and each node on the way looks the destination up in
+# its forwarding table (FIB). The packets of a batch always share their path, so a batch is one
+# DATA_PACKET_ARRIVAL event (arg3: flow source, packets, hops so far, injection time) whatever its
+# size. Data packets run after the routing messages and link updates of the same time stamp. A batch is
+#
+#     delivered    when it reaches dst
+#     looped       once it has taken TRAFFIC_TTL hops
+#     blackholed   at a node without a route (next hop None or -1), with a next hop that is not a
+#                  neighbor, or when the node it was sent to is gone
+#
+# FIB: per node {destination: next hop}, filled from the node's get_next_hop() on a miss and
+# dropped whenever the node handles a routing message or a link update, i.e. whenever its
+# routing may have changed. The report counts packets, FIB lookups (one per batch and hop) and
+# lookups per second of lookup time, and per TRAFFIC_BUCKET time units what became of the packets.
+
+BLACKHOLES = ('no route', 'not a neighbor', 'node gone')
+
+MISSING = object()
+
+
+class Traffic:
+
+    def __init__(self, sim, end):
+        self.sim = sim
+        self.end = end
+        # (src, dst) -> (rate, generation); a new rate starts a new chain of injections
+        self.flows = {}
+        self.generation = 0
+        self.sequence = 0
+        self.fib = {}
+        self.sent = 0
+        self.delivered = 0
+        self.looped = 0
+        self.blackholed = dict.fromkeys(BLACKHOLES, 0)
+        # Time units from injection to delivery, over all delivered packets
+        self.delay = 0
+        self.lookups = 0
+        self.misses = 0
+        self.lookup_time = 0.0
+        # bucket -> [sent, delivered, looped, blackholed]
+        self.timeline = {}
+
+    def post(self, time_stamp, event_type, arg1, arg2, arg3):
+        self.sim.event_queue.Post(Event(time_stamp, event_type, arg1, arg2, arg3, seq=self.sequence))
+        self.sequence += 1
+
+    def count(self, column, packets):
+        bucket = self.sim.get_time() // TRAFFIC_BUCKET * TRAFFIC_BUCKET
+        row = self.timeline.get(bucket)
+        if row is None:
+            row = self.timeline[bucket] = [0, 0, 0, 0]
+        row[column] += packets
+
+    def send_traffic(self, src, dst, rate):
+        self.generation += 1
+        if rate > 0:
+            self.flows[src, dst] = (rate, self.generation)
+            self.post(self.sim.get_time(), EVENT_TYPE.INJECT_TRAFFIC, src, dst, self.generation)
+        else:
+            self.flows.pop((src, dst), None)
+
+    def inject(self, src, dst, generation):
+        flow = self.flows.get((src, dst))
+        now = self.sim.get_time()
+        if flow is None or flow[1] != generation or now >= self.end:
+            return
+        packets = flow[0] * TRAFFIC_INTERVAL
+        self.sent += packets
+        self.count(0, packets)
+        self.post(now + TRAFFIC_INTERVAL, EVENT_TYPE.INJECT_TRAFFIC, src, dst, generation)
+        self.forward(src, dst, (src, packets, 0, now))
+
+    def forward(self, node, dst, batch):
+        src, packets, hops, injected = batch
+        if node not in self.sim.nodes:
+            self.drop('node gone', packets)
+            return
+        if node == dst:
+            self.delivered += packets
+            self.delay += (self.sim.get_time() - injected) * packets
+            self.count(1, packets)
+            return
+        if hops >= TRAFFIC_TTL:
+            self.looped += packets
+            self.count(2, packets)
+            return
+        next_hop = self.lookup(node, dst)
+        if next_hop is None or next_hop == -1:
+            self.drop('no route', packets)
+            return
+        latency = self.sim.latency(node, next_hop)
+        if latency is None:
+            self.drop('not a neighbor', packets)
+            return
+        self.post(self.sim.get_time() + latency, EVENT_TYPE.DATA_PACKET_ARRIVAL, next_hop, dst,
+                  (src, packets, hops + 1, injected))
+
+    def drop(self, reason, packets):
+        self.blackholed[reason] += packets
+        self.count(3, packets)
+
+    def lookup(self, node, dst):
+        started = time.perf_counter()
+        self.lookups += 1
+        fib = self.fib.get(node)
+        if fib is None:
+            fib = self.fib[node] = {}
+        next_hop = fib.get(dst, MISSING)
+        if next_hop is MISSING:
+            self.misses += 1
+            next_hop = fib[dst] = self.sim.nodes[node].get_next_hop(dst)
+        self.lookup_time += time.perf_counter() - started
+        return next_hop
+
+    def invalidate(self, node):
+        self.fib.pop(node, None)
+
+    def report(self):
+        blackholed = sum(self.blackholed.values())
+        in_flight = self.sent - self.delivered - self.looped - blackholed
+        ans = "Traffic: %d packets sent, %d delivered (%.1f%%, mean delay %.1f), %d looped, %d blackholed (%s), %d in flight\n" % (
+            self.sent, self.delivered, 100 * self.delivered / max(self.sent, 1), self.delay / max(self.delivered, 1),
+            self.looped, blackholed, ", ".join("%s %d" % item for item in self.blackholed.items()), in_flight)
+        ans += "FIB: %d lookups, %.1f%% hits, %.0f lookups/s\n" % (
+            self.lookups, 100 * (self.lookups - self.misses) / max(self.lookups, 1),
+            self.lookups / max(self.lookup_time, 1e-9))
+        ans += "Per %d time units (sent, delivered, looped, blackholed):\n" % TRAFFIC_BUCKET
+        for bucket in sorted(self.timeline):
+            ans += "    %d: %d, %d, %d, %d\n" % ((bucket,) + tuple(self.timeline[bucket]))
+        return ans
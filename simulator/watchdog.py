@@ -0,0 +1,88 @@
+from collections import Counter
+
+from simulator.config import *
+
+
+# Run limits.
+#
+# A run that does not settle (count to infinity, a node that keeps flooding) can keep the dispatch
+# loop busy for a very long time while the queue grows. The Watchdog looks at every event before it
+# is dispatched and tells the loop to stop once a limit is crossed:
+#
+#     max_time                  no event after this simulated time runs
+#     max_events                at most this many events are dispatched
+#     max_messages_per_second   at most this many routing messages are delivered with one time stamp
+#     max_queue_depth           at most this many events may be waiting
+#
+# None means no limit. The report lists the nodes and links that sent the most routing messages,
+# delivered and still waiting.
+
+
+class Run_Limits:
+
+    def __init__(self, max_time=MAX_TIME, max_events=MAX_EVENTS,
+                 max_messages_per_second=MAX_MESSAGES_PER_SECOND, max_queue_depth=MAX_QUEUE_DEPTH):
+        self.max_time = max_time
+        self.max_events = max_events
+        self.max_messages_per_second = max_messages_per_second
+        self.max_queue_depth = max_queue_depth
+
+    def active(self):
+        return any(limit is not None for limit in (self.max_time, self.max_events,
+                                                   self.max_messages_per_second, self.max_queue_depth))
+
+
+class Watchdog:
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.events = 0
+        self.last_time = 0
+        self.second = None
+        self.second_messages = 0
+        self.senders = Counter()
+        self.links = Counter()
+        self.reason = None
+
+    def check(self, e, queue):
+        """Whether the run has to stop instead of dispatching e (just taken from queue)."""
+        limits = self.limits
+        if limits.max_time is not None and e.time_stamp > limits.max_time:
+            self.reason = "next event at time %d is past the time limit %d" % (e.time_stamp, limits.max_time)
+        elif limits.max_events is not None and self.events >= limits.max_events:
+            self.reason = "dispatched the limit of %d events" % limits.max_events
+        elif limits.max_queue_depth is not None and len(queue) >= limits.max_queue_depth:
+            self.reason = "%d events waiting, the limit is %d" % (len(queue) + 1, limits.max_queue_depth)
+        elif e.event_type == EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL:
+            if e.time_stamp != self.second:
+                self.second, self.second_messages = e.time_stamp, 0
+            if limits.max_messages_per_second is not None and self.second_messages >= limits.max_messages_per_second:
+                self.reason = "more than %d routing messages at time %d" % (limits.max_messages_per_second, e.time_stamp)
+            else:
+                self.second_messages += 1
+                self.senders[e.sender] += 1
+                self.links[e.sender, e.arg1] += 1
+        if self.reason is not None:
+            return True
+        self.events += 1
+        self.last_time = e.time_stamp
+        return False
+
+    def report(self, queue, top=LIMIT_REPORT_TOP):
+        # Routing messages per sender and per (sender, receiver), delivered and waiting
+        pending_senders, pending_links = Counter(), Counter()
+        for e in queue:
+            if e.event_type == EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL:
+                pending_senders[e.sender] += 1
+                pending_links[e.sender, e.arg1] += 1
+        senders = self.senders + pending_senders
+        links = self.links + pending_links
+
+        ans = "Run stopped at time %d after %d events: %s\n" % (self.last_time, self.events, self.reason)
+        ans += "Top senders (delivered, waiting):\n"
+        for node, _ in senders.most_common(top):
+            ans += "    %s: %d, %d\n" % (node, self.senders[node], pending_senders[node])
+        ans += "Top links (delivered, waiting):\n"
+        for (node, neighbor), _ in links.most_common(top):
+            ans += "    %s -> %s: %d, %d\n" % (node, neighbor, self.links[node, neighbor], pending_links[node, neighbor])
+        return ans
@@ -0,0 +1,225 @@
+import os
+import sys
+import csv
+import json
+import glob
+import time
+import signal
+import hashlib
+import logging
+import argparse
+import itertools
+import resource
+import tempfile
+import multiprocessing
+
+from sim import Sim
+from simulator.config import *
+from simulator.recorder import Recording
+from simulator.watchdog import Run_Limits
+from simulator.metrics import peak_memory, resident_memory
+from generate_simulation import generate_events, MAX_LATENCY
+from generate_workload import generate_workload
+
+
+# Parameter sweeps.
+#
+# A grid (workload x nodes x degree x time x churn x algorithm x seed) is expanded into cells. Each
+# cell generates its scenario, leaving out the DRAW_* / DUMP_* / PRINT events: workload 'random' is
+# generate_simulation.generate_events (time, churn), anything else a generate_workload.py stress
+# pattern written as pattern[:scale[:intensity]], e.g. 'cascade:20:5' (time and churn unused).
+# It runs it in a fresh worker process (one per cell, so the peak memory is the cell's own) under
+# optional memory and CPU time limits and the MAX_* run limits. Workers are forked and start out
+# with the pages of the sweep process, so the memory column is the peak above the worker's resident
+# memory before the cell ran.
+#
+# Results are cached as JSON under SWEEP_CACHE_PATH, keyed by the cell parameters, the limits and
+# a hash of the simulator's source files, so a repeated or interrupted sweep only runs cells
+# that are missing or whose code changed.
+#
+# Per cell: status, routing messages, convergence time (the longest time from a topology change
+# to the last routing message before the next change, from a recording of the run), simulated
+# end time, wall time and peak resident memory added by the cell. With several seeds a second table averages them.
+
+GRID = ['workload', 'nodes', 'degree', 'time', 'churn', 'algorithm', 'seed']
+
+COLUMNS = GRID + ['status', 'messages', 'convergence', 'end_time', 'wall', 'memory_mb']
+
+
+def code_version():
+    """Hash of the simulator's Python sources, cached results of older code are not reused."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for filename in sorted(glob.glob(os.path.join(root, '*.py')) + glob.glob(os.path.join(root, 'simulator', '*.py'))):
+        digest.update(os.path.relpath(filename, root).encode())
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def expand(grid):
+    """Every combination of the grid's values, as dicts in GRID order."""
+    return [dict(zip(GRID, values)) for values in itertools.product(*(grid[key] for key in GRID))]
+
+
+def cell_key(cell, limits, version):
+    return hashlib.sha1(json.dumps([cell, limits, version], sort_keys=True).encode()).hexdigest()
+
+
+def cell_events(cell):
+    if cell['workload'] == 'random':
+        return generate_events(cell['nodes'], cell['degree'], cell['time'], cell['seed'], cell['churn'])
+    pattern, *numbers = cell['workload'].split(':')
+    return generate_workload(pattern, cell['nodes'], cell['degree'], cell['seed'], *[int(x) for x in numbers])
+
+
+def convergence_time(recording):
+    times = [last - change for change, _, _, last in recording.convergence() if last is not None]
+    return max(times, default=0)
+
+
+def cpu_time_exceeded(signum, frame):
+    raise TimeoutError("CPU time limit")
+
+
+def run_cell(job):
+    # In a fresh worker process: run one cell and return its row
+    cell, limits = job
+    baseline = resident_memory()
+    if limits['memory_mb'] is not None:
+        size = limits['memory_mb'] * 2 ** 20
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    if limits['cpu_seconds'] is not None:
+        signal.signal(signal.SIGXCPU, cpu_time_exceeded)
+        used = int(resource.getrusage(resource.RUSAGE_SELF).ru_utime)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + limits['cpu_seconds'], resource.RLIM_INFINITY))
+    logging.disable(logging.WARNING)
+
+    row = dict(cell, status='ok', messages=None, convergence=None, end_time=None, wall=None, memory_mb=None)
+    run_limits = Run_Limits(limits['max_time'], limits['max_events'],
+                            limits['max_messages_per_second'], limits['max_queue_depth'])
+    start = time.time()
+    with tempfile.TemporaryDirectory() as directory:
+        record = os.path.join(directory, 'cell.rec')
+        try:
+            events = (e for e in cell_events(cell) if e[1] not in OBSERVATION_EVENTS)
+            s = Sim(cell['algorithm'], events, 'NO_STOP', record=record, limits=run_limits)
+            if s.stopped is not None:
+                row['status'] = 'stopped: ' + s.stopped
+            row['messages'] = s.message_count
+            row['end_time'] = s.get_time()
+            recording = Recording(record)
+            row['convergence'] = convergence_time(recording)
+            del recording
+        except MemoryError:
+            row['status'] = 'memory limit'
+        except TimeoutError:
+            row['status'] = 'cpu limit'
+        except Exception as e:
+            row['status'] = 'error: %s: %s' % (type(e).__name__, e)
+        except SystemExit as e:
+            # The topology exits on some bad scenarios (e.g. a negative latency), keep the worker alive
+            row['status'] = 'error: exit %s' % e.code
+    row['wall'] = round(time.time() - start, 3)
+    row['memory_mb'] = round((peak_memory() - baseline) / 2 ** 20, 1)
+    return row
+
+
+def sweep(grid, limits, jobs=1, cache=SWEEP_CACHE_PATH, rerun=False):
+    """Run every cell of the grid that is not cached yet, returns all rows in grid order."""
+    os.makedirs(cache, exist_ok=True)
+    version = code_version()
+    cells = expand(grid)
+    keys = [cell_key(cell, limits, version) for cell in cells]
+    rows = {}
+    for key in keys:
+        filename = os.path.join(cache, key + '.json')
+        if not rerun and os.path.exists(filename):
+            with open(filename) as f:
+                rows[key] = json.load(f)
+
+    todo = [(key, cell) for key, cell in zip(keys, cells) if key not in rows]
+    print("%d cells, %d cached, %d to run" % (len(cells), len(cells) - len(todo), len(todo)), file=sys.stderr)
+    if todo:
+        with multiprocessing.Pool(jobs, maxtasksperchild=1) as pool:
+            done = pool.imap(run_cell, [(cell, limits) for _, cell in todo])
+            for (key, cell), row in zip(todo, done):
+                rows[key] = row
+                tmp = os.path.join(cache, "%s.%d.tmp" % (key, os.getpid()))
+                with open(tmp, 'w') as f:
+                    json.dump(row, f)
+                os.replace(tmp, os.path.join(cache, key + '.json'))
+                print("%s: %s" % (" ".join("%s=%s" % (k, cell[k]) for k in GRID), row['status']), file=sys.stderr)
+    return [rows[key] for key in keys]
+
+
+def summarize(rows):
+    """Mean over seeds of the numeric columns, for every other combination of the grid."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[key] for key in GRID if key != 'seed'), []).append(row)
+    summary = []
+    for values, group in groups.items():
+        ok = [row for row in group if row['status'] == 'ok']
+        mean = dict(zip([key for key in GRID if key != 'seed'], values))
+        mean['seed'] = "%d/%d ok" % (len(ok), len(group))
+        for column in COLUMNS[len(GRID) + 1:]:
+            numbers = [row[column] for row in ok]
+            mean[column] = round(sum(numbers) / len(numbers), 3) if numbers else None
+        mean['status'] = 'mean'
+        summary.append(mean)
+    return summary
+
+
+def print_table(rows):
+    table = [COLUMNS] + [["-" if row[column] is None else str(row[column]) for column in COLUMNS] for row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(COLUMNS))]
+    for line in table:
+        print("  ".join(item.ljust(width) for item, width in zip(line, widths)).rstrip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run generated scenarios over a grid of parameters and algorithms.')
+    parser.add_argument('--spec', metavar='FILE', help='JSON grid, e.g. {"nodes": [20, 50], "algorithm": ["LINK_STATE"]}; '
+                                                     'the options below fill in missing keys')
+    parser.add_argument('--workload', nargs='+', default=['random'],
+                        help="'random' (generate_simulation.py) or a stress pattern[:scale[:intensity]] (generate_workload.py)")
+    parser.add_argument('--nodes', type=int, nargs='+', default=[20])
+    parser.add_argument('--degree', type=int, nargs='+', default=[3])
+    parser.add_argument('--time', type=int, nargs='+', default=[1000])
+    parser.add_argument('--churn', type=int, nargs='+', default=[10 * MAX_LATENCY], help='average time between link changes')
+    parser.add_argument('--algorithm', nargs='+', choices=ROUTE_ALGORITHM, default=['LINK_STATE', 'DISTANCE_VECTOR'])
+    parser.add_argument('--seed', type=int, nargs='+', default=[0])
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='cells run at the same time')
+    parser.add_argument('--memory-mb', type=int, help='address space limit of each cell')
+    parser.add_argument('--cpu-seconds', type=int, help='CPU time limit of each cell')
+    parser.add_argument('--max-time', type=int, default=MAX_TIME)
+    parser.add_argument('--max-events', type=int, default=MAX_EVENTS)
+    parser.add_argument('--max-messages-per-second', type=int, default=MAX_MESSAGES_PER_SECOND)
+    parser.add_argument('--max-queue-depth', type=int, default=MAX_QUEUE_DEPTH)
+    parser.add_argument('--rerun', action='store_true', help='ignore cached results')
+    parser.add_argument('--out', metavar='FILE', help='also write the rows as CSV')
+    args = parser.parse_args()
+
+    grid = {key: getattr(args, key) for key in GRID}
+    if args.spec is not None:
+        with open(args.spec) as f:
+            grid.update(json.load(f))
+    limits = {key: getattr(args, key) for key in ('memory_mb', 'cpu_seconds', 'max_time', 'max_events',
+                                                  'max_messages_per_second', 'max_queue_depth')}
+
+    rows = sweep(grid, limits, args.jobs, rerun=args.rerun)
+    print_table(rows)
+    if len(grid['seed']) > 1:
+        print()
+        print_table(summarize(rows))
+    if args.out is not None:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    # Try: python sweep.py --nodes 20 40 --degree 3 --algorithm LINK_STATE DISTANCE_VECTOR --seed 1 2 3
+    main()
@@ -0,0 +1,139 @@
+import os
+import csv
+import glob
+import random
+import logging
+
+import pytest
+
+from sim import Sim, Partitioned_Sim
+from simulator.config import *
+from simulator import lsdb
+
+
+# The optimized route algorithms must end up with the same routing tables as the node they
+# replace: LINK_STATE_INCREMENTAL (shortest path tree repair), LINK_STATE_SHARED (copy-on-write
+# link state store) and DISTANCE_VECTOR_DENSE (NumPy matrix, same tie-breaking).
+# Run with: python -m pytest test_route_variants.py
+
+VARIANTS = [
+    ('LINK_STATE_INCREMENTAL', 'LINK_STATE'),
+    ('LINK_STATE_SHARED', 'LINK_STATE'),
+    ('DISTANCE_VECTOR_DENSE', 'DISTANCE_VECTOR')
+]
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = ['demo.event', 'test1.event'] + sorted(
+    os.path.relpath(file, ROOT) for file in glob.glob(os.path.join(ROOT, 'adversarial_cases', '*.event')))
+
+
+def scenario_events(file):
+    """The commands of an event file without drawings, dumps and comments."""
+    with open(os.path.join(ROOT, file)) as f:
+        for line in f:
+            items = line.split()
+            if items == [] or items[0].startswith('#') or items[1] in OBSERVATION_EVENTS:
+                continue
+            yield (int(items[0]), items[1]) + tuple(int(x) for x in items[2:])
+
+
+def grid_events(size):
+    """A size x size grid of equal latency links, then one link slower and one gone: every pair has tied paths."""
+    for node in range(size * size):
+        if node % size < size - 1:
+            yield (0, EVENT_TYPE.ADD_LINK, node, node + 1, 1)
+        if node < size * (size - 1):
+            yield (0, EVENT_TYPE.ADD_LINK, node, node + size, 1)
+    yield (100, EVENT_TYPE.CHANGE_LINK, 0, 1, 3)
+    yield (200, EVENT_TYPE.DELETE_LINK, size + 1, size + 2)
+
+
+def run(algorithm, scenario, workers=None, **kwargs):
+    # scenario: an event file name, or a list of events; workers: run a Partitioned_Sim
+    if isinstance(scenario, str):
+        scenario = scenario_events(scenario)
+    logging.disable(logging.WARNING)
+    try:
+        if workers is None:
+            return Sim(algorithm, scenario, 'NO_STOP', **kwargs)
+        return Partitioned_Sim(algorithm, scenario, 'NO_STOP', workers, **kwargs)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def routes(s):
+    return {(node, destination): s.nodes[node].get_next_hop(destination)
+            for node in s.nodes for destination in s.nodes if node != destination}
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+@pytest.mark.parametrize('variant, reference', VARIANTS)
+def test_variant_routes_like_reference(variant, reference, scenario):
+    s, expected = run(variant, scenario), run(reference, scenario)
+    assert routes(s) == routes(expected)
+    assert s.message_count == expected.message_count
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+def test_shared_link_state_folds(monkeypatch, scenario):
+    # These scenarios are too small to reach FOLD_MIN, fold after a handful of overlay entries
+    monkeypatch.setattr(lsdb, 'FOLD_MIN', 8)
+    s = run('LINK_STATE_SHARED', scenario)
+    assert sum(store.folds for store in s.shared_state.values()) > 0
+    assert routes(s) == routes(run('LINK_STATE', scenario))
+
+
+def test_shared_views_behave_like_dicts(monkeypatch):
+    # Random writes and deletes on views and plain dicts side by side, with folds, and views that
+    # join after a fold
+    monkeypatch.setattr(lsdb, 'FOLD_MIN', 8)
+    rng = random.Random(1)
+    store = lsdb.Shared_Store()
+    views, dicts = [], []
+    for step in range(3000):
+        if len(views) < 12 and step % 250 == 0:
+            views.append(store.view())
+            dicts.append({})
+        i = rng.randrange(len(views))
+        key = rng.randrange(20)
+        if rng.random() < 0.2:
+            if key in dicts[i]:
+                del dicts[i][key]
+                del views[i][key]
+            else:
+                with pytest.raises(KeyError):
+                    del views[i][key]
+        else:
+            value = {'seq': rng.randrange(3)}
+            dicts[i][key] = value
+            views[i][key] = value
+    assert store.folds > 0
+    for view, expected in zip(views, dicts):
+        assert dict(view.items()) == expected
+        assert len(view) == len(expected)
+        assert all((key in view) == (key in expected) for key in range(20))
+
+
+@pytest.mark.parametrize('variant, reference', VARIANTS)
+def test_variant_breaks_ties_like_reference(variant, reference):
+    events = list(grid_events(4))
+    s, expected = run(variant, events), run(reference, events)
+    assert routes(s) == routes(expected)
+    assert s.message_count == expected.message_count
+
+
+@pytest.mark.parametrize('scenario', ['demo.event', 'test1.event', 'adversarial_cases/delete_and_rebuild.event'])
+@pytest.mark.parametrize('algorithm', ['LINK_STATE', 'DISTANCE_VECTOR'])
+def test_workers_run_like_sequential(algorithm, scenario, tmp_path):
+    # Workers only live until the end of the run, compare the routes they export
+    def exported(name):
+        with open(tmp_path / name) as f:
+            return list(csv.reader(f))
+
+    expected = run(algorithm, scenario, export=str(tmp_path / 'sequential.csv'))
+    for workers in (1, 2, 3):
+        name = 'workers_%d.csv' % workers
+        s = run(algorithm, scenario, workers, export=str(tmp_path / name))
+        assert s.message_count == expected.message_count
+        assert exported(name) == exported('sequential.csv')
@@ -0,0 +1,167 @@
+import csv
+import logging
+
+import numpy as np
+import networkx as nx
+import pytest
+
+from sim import Sim
+from simulator.config import *
+from simulator.node import Node
+from simulator.recorder import Recording
+from simulator.watchdog import Run_Limits
+
+
+# Simulator features around the routing algorithms: node API, recording, export, run limits, traffic.
+# Run with: python -m pytest test_simulator.py
+
+
+class Own_Logger_Node(Node):
+    def __init__(self, id):
+        super().__init__(id)
+        self.logging = logging.getLogger('own %d' % id)
+
+
+def test_node_logger_is_cached_and_can_be_replaced():
+    node = Node(7)
+    assert node.logging is node.logging
+    assert node.logging.name == 'Node 7'
+    assert Own_Logger_Node(8).logging.name == 'own 8'
+
+
+# A ring of six nodes with different latencies, then one link slower, one gone and back again
+RING = [(0, EVENT_TYPE.ADD_LINK, node, (node + 1) % 6, 1 + node) for node in range(6)] + [
+    (100, EVENT_TYPE.CHANGE_LINK, 0, 1, 20),
+    (200, EVENT_TYPE.DELETE_LINK, 2, 3),
+    (300, EVENT_TYPE.ADD_LINK, 2, 3, 1)]
+
+
+class Delivery_Log_Sim(Sim):
+    # Receiver and length of every routing message delivered, for comparison with the recording
+
+    def __init__(self, *args, **kwargs):
+        self.delivered = []
+        super().__init__(*args, **kwargs)
+
+    def routing_message_arrival(self, neighbor, m):
+        self.delivered.append((self.get_time(), neighbor, len(m)))
+        super().routing_message_arrival(neighbor, m)
+
+
+def run(algorithm, events, sim=Sim, **kwargs):
+    logging.disable(logging.WARNING)
+    try:
+        return sim(algorithm, events, 'NO_STOP', **kwargs)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def test_recording_round_trip(tmp_path):
+    record = str(tmp_path / 'ring.rec')
+    s = run('LINK_STATE', RING, Delivery_Log_Sim, record=record)
+    recording = Recording(record)
+    assert recording.header['algorithm'] == 'LINK_STATE'
+
+    messages = recording.of_type(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL)
+    assert len(messages) == s.message_count == len(s.delivered)
+    traffic = recording.node_traffic()
+    for node in s.nodes:
+        received = [size for _, neighbor, size in s.delivered if neighbor == node]
+        assert traffic[node][0] == s.sent_count[node]
+        assert traffic[node][2:] == (len(received), sum(received))
+    assert sum(count for count, _ in recording.link_load().values()) == s.message_count
+
+    changes = [0, 100, 200, 300, float('inf')]
+    times = sorted(t for t, _, _ in s.delivered)
+    expected = []
+    for change, following in zip(changes, changes[1:]):
+        owned = [t for t in times if change <= t < following]
+        expected.append((change, 6 if change == 0 else 1, len(owned), max(owned, default=None)))
+    assert recording.convergence() == expected
+
+
+@pytest.mark.parametrize('algorithm', ['LINK_STATE', 'DISTANCE_VECTOR'])
+def test_export_round_trip(algorithm, tmp_path):
+    # Sparse node ids, and one node gone by the end
+    events = [(t, event_type, 10 * node1, 10 * node2, *rest) for t, event_type, node1, node2, *rest in RING]
+    events.append((400, EVENT_TYPE.DELETE_NODE, 40))
+    s = run(algorithm, events, export=str(tmp_path / 'routes.npz'))
+    s.export_routes(str(tmp_path / 'routes.csv'))
+
+    nodes = sorted(s.nodes)
+    lengths = {node: nx.single_source_dijkstra_path_length(s.graph(), node, weight='latency') for node in nodes}
+    routes = np.load(tmp_path / 'routes.npz')
+    assert routes['nodes'].tolist() == nodes
+    assert int(routes['time']) == s.get_time()
+    for i, source in enumerate(nodes):
+        table = s.routing_table(source)
+        for j, destination in enumerate(nodes):
+            hop, cost = table.get(destination, (None, float('inf')))
+            assert routes['next_hop'][i, j] == (-1 if hop is None else nodes.index(hop))
+            assert routes['cost'][i, j] == cost
+            assert routes['distance'][i, j] == lengths[source].get(destination, float('inf'))
+
+    with open(tmp_path / 'routes.csv') as f:
+        rows = list(csv.DictReader(f))
+    expected = {(source, destination) for source in nodes for destination in nodes
+                if destination in s.routing_table(source) or destination in lengths[source]}
+    assert {(int(row['source']), int(row['destination'])) for row in rows} == expected
+    for row in rows:
+        source, destination = int(row['source']), int(row['destination'])
+        hop, cost = s.routing_table(source).get(destination, (-1, float('inf')))
+        assert (int(row['next_hop']), float(row['cost'])) == (hop, cost)
+        assert float(row['distance']) == lengths[source].get(destination, float('inf'))
+
+
+@pytest.mark.parametrize('limits, reason', [
+    (Run_Limits(max_time=150), "next event at time 200 is past the time limit 150"),
+    (Run_Limits(max_events=40), "dispatched the limit of 40 events"),
+    (Run_Limits(max_messages_per_second=2), "more than 2 routing messages at time 1"),
+    (Run_Limits(max_queue_depth=10), "11 events waiting, the limit is 10")])
+def test_run_limits_stop_at_last_dispatched_event(limits, reason, tmp_path):
+    record = str(tmp_path / 'ring.rec')
+    s = run('LINK_STATE', RING, record=record, limits=limits)
+    assert s.stopped == reason
+
+    # The clock stays at the last event that ran, the one that crossed the limit is still waiting
+    records = Recording(record).records
+    assert s.get_time() == records['time'][-1]
+    assert s.event_queue.Peek().time_stamp >= s.get_time()
+    if limits.max_time is not None:
+        assert s.get_time() <= limits.max_time < s.event_queue.Peek().time_stamp
+    if limits.max_events is not None:
+        assert len(records) == limits.max_events
+    if limits.max_messages_per_second is not None:
+        messages = Recording(record).of_type(EVENT_TYPE.ROUTING_MESSAGE_ARRIVAL)
+        assert (messages['time'] == 1).sum() == limits.max_messages_per_second
+    if limits.max_queue_depth is not None:
+        assert len(s.event_queue) == limits.max_queue_depth + 1
+
+
+class Hop_Log_Sim(Sim):
+    # Node of every batch hop, and whether the FIB entry it left matches the node's routing now
+
+    def __init__(self, *args, **kwargs):
+        self.hops = []
+        super().__init__(*args, **kwargs)
+
+    def data_packet_arrival(self, node, dst, batch):
+        super().data_packet_arrival(node, dst, batch)
+        fib = self.traffic.fib.get(node, {})
+        self.hops.append((self.get_time(), node, dst not in fib or fib[dst] == self.nodes[node].get_next_hop(dst)))
+
+
+def test_traffic_follows_changed_routes():
+    # 0 -> 3 goes over 1 and 2 until the link (0, 1) gets slow at time 100, then over 5 and 4
+    s = run('LINK_STATE', RING + [(10, EVENT_TYPE.SEND_TRAFFIC, 0, 3, 1)], Hop_Log_Sim)
+    assert all(fresh for _, _, fresh in s.hops)
+    before = {node for t, node, _ in s.hops if t < 100}
+    after = {node for t, node, _ in s.hops if t > 150}
+    assert before == {1, 2, 3}
+    assert after == {5, 4, 3}
+
+    traffic = s.traffic
+    assert traffic.sent == 300 - 10
+    assert traffic.looped == sum(traffic.blackholed.values()) == 0
+    # Entries dropped after the change were looked up again
+    assert traffic.misses > 3